@@ -0,0 +1,308 @@
+"""
+流水线各环节的性能基准（合成数据，规模 1k ~ 100k 行）
+
+覆盖：Usher.process_line / process_file_batch、Masque.replace_names / remove_parentheses、
+场景 JSON → JSONL（SpeechGenApp.generate_jsonl_from_scene 所用的 scene_config）、
+从 JSONL / 紧凑格式文件按需读取并分配任务（JsonlSource、CompactJobSource + build_jobs）、
+以及 WorkerThread 对本地模拟服务端（tool/mock_tts.py）的端到端生成。
+
+用法：
+    python bench/bench_pipeline.py --save bench/baseline.json
+    python bench/bench_pipeline.py --compare bench/baseline.json --threshold 0.15
+    python bench/bench_pipeline.py --sizes 1000 10000 --only usher scene
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOL_DIR = os.path.join(PROJECT_ROOT, "tool")
+if TOOL_DIR not in sys.path:
+    sys.path.append(TOOL_DIR)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_E2E_MAX = 10000  # 端到端测试走 HTTP，默认不跑 100k
+DEFAULT_THRESHOLD = 0.15
+
+CHARACTER_MAP = {"爱音": "anon", "灯": "tomori", "立希": "taki", "爽世": "soyo", "乐奈": "rana",
+                 "祥子": "sakiko", "睦": "mutsumi", "初华": "uika", "海铃": "umiri", "若麦": "nyamu"}
+EMOTIONS = ("idle", "happy", "sad", "angry")
+PHRASES = ("今天也要加油哦", "（小声）我知道了", "这首歌是为了大家而写的", "诶？真的吗(笑)",
+           "……没关系，我们再来一次吧", "立希说得对，爱音也要好好练习", "灯，你的歌词写好了吗")
+
+
+def synthetic_dialogues(count, seed=0):
+    """生成 Usher 输入格式的对白：角色:台词 -fontSize=default;，夹杂少量旁白行"""
+    rng = random.Random(seed)
+    names = list(CHARACTER_MAP)
+    lines = []
+    for i in range(count):
+        if i % 20 == 19:
+            lines.append("changeBg:bg_room.webp -next;")
+        else:
+            lines.append(f"{rng.choice(names)}:{rng.choice(PHRASES)} -fontSize=default;")
+    return lines
+
+
+def synthetic_scene(count, seed=0):
+    """场景 JSON：{角色: [{"text", "emotion"}, ...]}"""
+    rng = random.Random(seed)
+    scene = {}
+    for i in range(count):
+        character = rng.choice(list(CHARACTER_MAP.values()))
+        scene.setdefault(character, []).append({"text": rng.choice(PHRASES), "emotion": rng.choice(EMOTIONS)})
+    return scene
+
+
+def synthetic_presets():
+    presets, emotions = {}, {}
+    for character in CHARACTER_MAP.values():
+        for emotion in EMOTIONS[:3]:
+            key = f"{character}_{emotion}"
+            presets[key] = {"text_lang": "all_ja", "prompt_lang": "all_ja", "ref_audio_path": f"{key}.wav",
+                            "prompt_text": "こんにちは", "gpt_weight": f"GPT_weights_v2/{character}.ckpt",
+                            "sovits_weight": f"SoVITS_weights_v2/{character}.pth", "sample_steps": 8}
+            emotions.setdefault(character, {})[emotion] = key
+    return presets, emotions
+
+
+def synthetic_jsonl(count, seed=0):
+    presets, emotions = synthetic_presets()
+    from scene_config import scene_configs
+    defaults = {"text_lang": "all_zh", "prompt_lang": "all_zh", "ref_audio_path": "default.wav",
+                "prompt_text": "", "gpt_weight": "", "sovits_weight": "", "sample_steps": 8}
+    return list(scene_configs(synthetic_scene(count, seed), presets, emotions, defaults))
+
+
+# ---------- 各项基准：返回被测函数（无参数），准备工作不计时 ----------
+
+def bench_usher_process_line(size, workdir):
+    from Usher import process_line
+    lines = synthetic_dialogues(size)
+
+    def run():
+        count_map = {}
+        for line in lines:
+            process_line(line, "test", "y", CHARACTER_MAP, count_map)
+    return run
+
+
+def bench_usher_process_file_batch(size, workdir):
+    from Usher import process_file_batch
+    lines = synthetic_dialogues(size)
+    per_file = 1000
+    paths = []
+    for i in range(0, size, per_file):
+        path = os.path.join(workdir, f"scene{i // per_file:03d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines[i:i + per_file]))
+        paths.append(path)
+    output_folder = os.path.join(workdir, "usher_out")
+
+    def run():
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            process_file_batch(paths, CHARACTER_MAP, "y", "y", "n", output_folder)
+    return run
+
+
+def import_masque():
+    # Masque 导入时要求配置 API 密钥并创建客户端（不会联网），基准只用到纯文本函数
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    import Masque
+    return Masque
+
+
+def bench_masque_replace_names(size, workdir):
+    masque = import_masque()
+    texts = [line.split(":", 1)[-1] for line in synthetic_dialogues(size)]
+
+    def run():
+        for text in texts:
+            masque.replace_names(text, CHARACTER_MAP)
+    return run
+
+
+def bench_masque_remove_parentheses(size, workdir):
+    masque = import_masque()
+    texts = [line.split(":", 1)[-1] for line in synthetic_dialogues(size)]
+
+    def run():
+        for text in texts:
+            masque.remove_parentheses(text)
+    return run
+
+
+def bench_scene_to_jsonl(size, workdir):
+    from scene_config import write_scene_jsonl
+    scene = synthetic_scene(size)
+    presets, emotions = synthetic_presets()
+    defaults = {"text_lang": "all_zh", "prompt_lang": "all_zh", "ref_audio_path": "default.wav",
+                "prompt_text": "", "gpt_weight": "", "sovits_weight": "", "sample_steps": 8}
+    output_path = os.path.join(workdir, "scene.jsonl")
+
+    def run():
+        write_scene_jsonl(scene, presets, emotions, defaults, output_path)
+    return run
+
+
+def bench_jsonl_build_jobs(size, workdir):
+    from jsonl_source import JsonlSource
+    from vocal_jobs import build_jobs
+    path = os.path.join(workdir, "jobs.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for config in synthetic_jsonl(size):
+            f.write(json.dumps(config, ensure_ascii=False) + "\n")
+
+    def run():
+        build_jobs(JsonlSource(path), "anon_bench", workdir)
+    return run
+
+
+def bench_compact_build_jobs(size, workdir):
+    from compact_jobs import CompactJobSource, write_jobs
+    from vocal_jobs import build_jobs
+    path = os.path.join(workdir, "jobs.cjsonl")
+    write_jobs(synthetic_jsonl(size), path, compact=True)
+
+    def run():
+        build_jobs(CompactJobSource(path), "anon_bench", workdir)
+    return run
+
+
+def bench_worker_end_to_end(size, workdir):
+    """WorkerThread 全流程（分组、调度、写文件、清单、运行日志），模拟服务端不计合成用时"""
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QCoreApplication
+    app = QCoreApplication.instance() or QCoreApplication([])
+    from gen_vocal import WorkerThread
+    from tts_dispatcher import Backend
+    from mock_tts import MockTTSServer
+
+    data_list = synthetic_jsonl(size)
+    server = MockTTSServer(port=0, per_char=0.0, base_latency=0.0, jitter=0.0, switch_penalty=0.0,
+                           sec_per_char=0.02, seed=0)
+    base_url = server.start()
+    runs = [0]
+
+    def run():
+        runs[0] += 1
+        output_root = os.path.join(workdir, f"e2e{runs[0]}")
+        worker = WorkerThread(data_list, "bench_e2e", output_root, schedule="weights",
+                              backends=[Backend(base_url)])
+        worker.finished.connect(app.quit)
+        worker.start()
+        app.exec_()
+        worker.wait()
+    run.cleanup = server.stop
+    return run
+
+
+BENCHMARKS = {
+    "usher.process_line": bench_usher_process_line,
+    "usher.process_file_batch": bench_usher_process_file_batch,
+    "masque.replace_names": bench_masque_replace_names,
+    "masque.remove_parentheses": bench_masque_remove_parentheses,
+    "scene.to_jsonl": bench_scene_to_jsonl,
+    "jsonl.build_jobs": bench_jsonl_build_jobs,
+    "compact.build_jobs": bench_compact_build_jobs,
+    "worker.end_to_end": bench_worker_end_to_end,
+}
+
+
+def run_benchmarks(sizes, repeat=3, only=None, e2e_max=DEFAULT_E2E_MAX, log=print):
+    """每项取 repeat 次中的最短用时，返回 {"名称@行数": {"seconds", "lines_per_sec"}}"""
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        for size in sizes:
+            if name == "worker.end_to_end" and size > e2e_max:
+                continue
+            key = f"{name}@{size}"
+            with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+                try:
+                    run = factory(size, workdir)
+                except ImportError as e:
+                    log(f"跳过 {key}：{e}")
+                    results[key] = {"skipped": str(e)}
+                    break
+                try:
+                    timings = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        run()
+                        timings.append(time.perf_counter() - start)
+                finally:
+                    if hasattr(run, "cleanup"):
+                        run.cleanup()
+            best = min(timings)
+            results[key] = {"seconds": round(best, 6), "lines_per_sec": round(size / best, 1)}
+            log(f"{key:<40} {best:10.4f}s  {size / best:12.0f} 行/s")
+    return results
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """返回 (变慢超过阈值的项, 报告文字行)"""
+    regressions = []
+    lines = []
+    for key, current in results.items():
+        old = baseline.get("results", {}).get(key)
+        if not old or "seconds" not in old or "seconds" not in current:
+            continue
+        ratio = current["seconds"] / old["seconds"] if old["seconds"] else 1.0
+        mark = "❌ 变慢" if ratio > 1 + threshold else ("✅ 变快" if ratio < 1 - threshold else "  持平")
+        lines.append(f"{mark} {key:<40} {old['seconds']:.4f}s → {current['seconds']:.4f}s ({ratio - 1:+.1%})")
+        if ratio > 1 + threshold:
+            regressions.append(key)
+    return regressions, lines
+
+
+def environment():
+    import numpy
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count(),
+            "numpy": numpy.__version__, "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流水线性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="输入行数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最短）")
+    parser.add_argument("--only", nargs="+", help="只运行名称以此开头的项，如 usher scene worker")
+    parser.add_argument("--e2e-max", type=int, default=DEFAULT_E2E_MAX, help="端到端测试的最大行数")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与已有基线比较，有项变慢超过阈值时返回 1")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定变慢的比例")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.only, args.e2e_max)
+    report = {"environment": environment(), "results": results}
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions, lines = compare(baseline, results, args.threshold)
+        print(f"\n与基线比较（{baseline.get('environment', {}).get('time', '?')}，阈值 {args.threshold:.0%}）：")
+        for line in lines:
+            print(line)
+        if regressions:
+            print(f"\n{len(regressions)} 项变慢：{', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
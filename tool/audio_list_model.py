@@ -0,0 +1,135 @@
+import os
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+from PyQt5.QtGui import QBrush, QColor
+
+
+COLUMNS = ("已生成音频文件", "角色", "场景", "质量检查")
+PATH, CHARACTER, SCENE, FLAGS = range(len(COLUMNS))
+FLAGGED_BRUSH = QBrush(QColor("red"))
+
+
+def split_audio_path(relative_path):
+    """
+    由输出文件的相对路径得到 (角色, 场景)
+
+    标准输出为 {角色}/{场景}/{文件}；只有文件名时按 {角色}_{场景}_{编号} 拆分。
+    """
+    parts = relative_path.replace("\\", "/").split("/")
+    if len(parts) >= 3:
+        return parts[-3], parts[-2]
+    pieces = os.path.splitext(parts[-1])[0].split("_")
+    if len(pieces) >= 3:
+        return pieces[0], "_".join(pieces[1:-1])
+    return "", ""
+
+
+class AudioListModel(QAbstractTableModel):
+    """
+    已生成音频列表：每行 [相对路径, 角色, 场景, 未通过的质量检查项]
+
+    只在视图需要显示某行时才生成显示数据，几万行也不会创建对应数量的控件对象；
+    新文件按批插入，同一路径再次生成（重新生成）时只清除质量标记。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.row_of = {}  # 相对路径 → 行号
+        self.characters = set()
+        self.scenes = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return row[index.column()]
+        if role == Qt.ForegroundRole and row[FLAGS]:
+            return FLAGGED_BRUSH
+        if role == Qt.ToolTipRole and row[FLAGS]:
+            return row[FLAGS]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def path_at(self, row):
+        return self.rows[row][PATH]
+
+    def add_paths(self, paths):
+        """
+        追加一批文件，已存在的清除质量标记
+
+        Returns:
+            是否出现了新的角色或场景（界面据此更新筛选下拉框）
+        """
+        new_rows = []
+        for path in paths:
+            row = self.row_of.get(path)
+            if row is not None:
+                self.set_flags(row, "")
+                continue
+            self.row_of[path] = len(self.rows) + len(new_rows)
+            character, scene = split_audio_path(path)
+            new_rows.append([path, character, scene, ""])
+        if not new_rows:
+            return False
+
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+        self.rows.extend(new_rows)
+        self.endInsertRows()
+
+        count = len(self.characters) + len(self.scenes)
+        self.characters.update(row[CHARACTER] for row in new_rows)
+        self.scenes.update(row[SCENE] for row in new_rows)
+        return len(self.characters) + len(self.scenes) != count
+
+    def flag_paths(self, items):
+        """items: [(相对路径, 未通过的项), ...]"""
+        for path, reason in items:
+            row = self.row_of.get(path)
+            if row is not None:
+                self.set_flags(row, reason)
+
+    def set_flags(self, row, reason):
+        if self.rows[row][FLAGS] == reason:
+            return
+        self.rows[row][FLAGS] = reason
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.row_of = {}
+        self.characters = set()
+        self.scenes = set()
+        self.endResetModel()
+
+
+class AudioFilterProxy(QSortFilterProxyModel):
+    """按角色、场景筛选（空字符串表示全部），并提供按列排序"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.character = ""
+        self.scene = ""
+
+    def set_filter(self, character="", scene=""):
+        self.character = character
+        self.scene = scene
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        row = self.sourceModel().rows[source_row]
+        return ((not self.character or row[CHARACTER] == self.character)
+                and (not self.scene or row[SCENE] == self.scene))
@@ -0,0 +1,218 @@
+import io
+import os
+import wave
+import shutil
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from run_manifest import atomic_write_bytes
+
+
+# 首尾静音判定阈值（dBFS）与保留的余量（秒）
+SILENCE_THRESHOLD_DB = -45.0
+SILENCE_PADDING = 0.08
+# 响度统一的目标（LUFS）与峰值上限（dBFS）
+DEFAULT_TARGET_LUFS = -18.0
+PEAK_CEILING_DB = -1.0
+# 编码：名称 -> (ffmpeg 编码器, 扩展名)
+ENCODERS = {
+    "opus": ("libopus", ".ogg"),
+    "vorbis": ("libvorbis", ".ogg"),
+}
+DEFAULT_BITRATE = "48k"
+
+
+def read_wav(path):
+    """读取 16 位 PCM WAV，返回 (float32 样本 [帧, 声道], 采样率)；其他格式返回 (None, None)"""
+    with wave.open(path, "rb") as reader:
+        params = reader.getparams()
+        frames = reader.readframes(reader.getnframes())
+    if params.sampwidth != 2:
+        return None, None
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, params.nchannels)
+    return samples.astype(np.float32) / 32768.0, params.framerate
+
+
+def write_wav(path, samples, rate):
+    pcm = np.clip(np.round(samples * 32768.0), -32768, 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(samples.shape[1])
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(pcm.tobytes())
+    atomic_write_bytes(path, buffer.getvalue())
+
+
+def trim_silence(samples, rate, threshold_db=SILENCE_THRESHOLD_DB, padding=SILENCE_PADDING):
+    """按 10ms 帧的 RMS 去掉首尾静音，两端各保留 padding 秒；整段都低于阈值时原样返回"""
+    frame = max(1, rate // 100)
+    count = len(samples) // frame
+    if count == 0:
+        return samples
+    energy = np.mean(samples[:count * frame].reshape(count, -1) ** 2, axis=1)
+    loud = np.flatnonzero(energy > 10 ** (threshold_db / 10))
+    if len(loud) == 0:
+        return samples
+    pad = int(rate * padding)
+    start = max(0, loud[0] * frame - pad)
+    end = min(len(samples), (loud[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def _biquad_response(b, a, omega):
+    z = np.exp(-1j * omega)
+    return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+
+def k_weighting_gain(rate, length):
+    """
+    ITU-R BS.1770 K 计权（高架 + 高通两级滤波）在 rfft 各频点上的幅度响应
+
+    按采样率重新计算系数，不依赖 scipy；响度只与能量有关，忽略相位不影响结果。
+    """
+    omega = 2 * np.pi * np.fft.rfftfreq(length, 1.0 / rate) / rate
+
+    # 高架：+4dB，1500Hz
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / rate
+    alpha = np.sin(w0) / (2 * (1 / np.sqrt(2)))
+    cos_w0 = np.cos(w0)
+    shelf_b = (gain * ((gain + 1) + (gain - 1) * cos_w0 + 2 * np.sqrt(gain) * alpha),
+               -2 * gain * ((gain - 1) + (gain + 1) * cos_w0),
+               gain * ((gain + 1) + (gain - 1) * cos_w0 - 2 * np.sqrt(gain) * alpha))
+    shelf_a = ((gain + 1) - (gain - 1) * cos_w0 + 2 * np.sqrt(gain) * alpha,
+               2 * ((gain - 1) - (gain + 1) * cos_w0),
+               (gain + 1) - (gain - 1) * cos_w0 - 2 * np.sqrt(gain) * alpha)
+
+    # 高通：38Hz
+    w0 = 2 * np.pi * 38.0 / rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    cos_w0 = np.cos(w0)
+    high_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    high_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    return np.abs(_biquad_response(shelf_b, shelf_a, omega) * _biquad_response(high_b, high_a, omega))
+
+
+def integrated_loudness(samples, rate):
+    """
+    BS.1770 风格的积分响度（LUFS）：K 计权后按 400ms 块（75% 重叠）求能量，
+    先做 -70 LUFS 绝对门限，再做相对 -10 LU 门限；音频短于一个块或全为静音时返回 None
+    """
+    length = len(samples)
+    block = int(rate * 0.4)
+    if length < block:
+        return None
+    weighted = np.fft.irfft(np.fft.rfft(samples, axis=0) * k_weighting_gain(rate, length)[:, None],
+                            n=length, axis=0)
+
+    step = block // 4
+    starts = np.arange(0, length - block + 1, step)
+    power = np.cumsum(np.concatenate((np.zeros((1, samples.shape[1])), weighted ** 2)), axis=0)
+    energy = ((power[starts + block] - power[starts]) / block).sum(axis=1)
+
+    def to_lufs(value):
+        return -0.691 + 10 * np.log10(value)
+
+    with np.errstate(divide="ignore"):
+        gated = energy[to_lufs(energy) > -70.0]
+    if len(gated) == 0:
+        return None
+    relative = to_lufs(np.mean(gated)) - 10.0
+    gated = gated[to_lufs(gated) > relative]
+    return float(to_lufs(np.mean(gated)))
+
+
+def normalize_loudness(samples, rate, target_lufs=DEFAULT_TARGET_LUFS, ceiling_db=PEAK_CEILING_DB):
+    """把积分响度调到 target_lufs，峰值超过上限时整体压低；返回 (样本, 增益 dB)"""
+    loudness = integrated_loudness(samples, rate)
+    if loudness is None:
+        return samples, 0.0
+    gain_db = target_lufs - loudness
+    peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+    if peak > 0:
+        gain_db = min(gain_db, ceiling_db - 20 * np.log10(peak))
+    return samples * np.float32(10 ** (gain_db / 20)), float(gain_db)
+
+
+def encode_audio(path, encoder="opus", bitrate=DEFAULT_BITRATE):
+    """用 ffmpeg 把 WAV 编码为同名的压缩文件（原 WAV 保留），返回输出路径"""
+    codec, extension = ENCODERS[encoder]
+    output_path = os.path.splitext(path)[0] + extension
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", path,
+               "-c:a", codec, "-b:a", bitrate, "-f", "ogg", tmp_path]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=300)
+        os.replace(tmp_path, output_path)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg 编码失败: {e.stderr.decode('utf-8', 'replace').strip()}") from e
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+def process_file(path, trim=True, normalize=True, target_lufs=DEFAULT_TARGET_LUFS,
+                 encode=None, bitrate=DEFAULT_BITRATE):
+    """
+    后处理一条语音：去首尾静音、统一响度（原地覆盖 WAV），再按需编码
+
+    在子进程中执行，返回可序列化的结果 dict。
+    """
+    result = {"path": path}
+    if trim or normalize:
+        samples, rate = read_wav(path)
+        if samples is not None:
+            original = len(samples)
+            if trim:
+                samples = trim_silence(samples, rate)
+                result["trimmed"] = round((original - len(samples)) / rate, 3)
+            if normalize:
+                samples, gain_db = normalize_loudness(samples, rate, target_lufs)
+                result["gain_db"] = round(gain_db, 2)
+            write_wav(path, samples, rate)
+    if encode:
+        encoded_path = encode_audio(path, encode, bitrate)
+        result["encoded"] = encoded_path
+        result["bytes"] = os.path.getsize(encoded_path)
+    return result
+
+
+class AudioPostProcessor:
+    """
+    用进程池并行做后处理：合成线程写完文件后提交即返回，不阻塞下一条 TTS 请求
+
+    options 直接传给 process_file；wait() 等待全部完成并关闭进程池。
+    子进程以 spawn 方式启动：调用方是多线程的 Qt 程序，fork 可能复制其他线程持有的锁而死锁；
+    子进程只需要本模块（process_file），调用方的模块不应在导入时初始化音频设备或网络连接。
+    """
+
+    def __init__(self, workers=None, **options):
+        if options.get("encode") and shutil.which("ffmpeg") is None:
+            raise RuntimeError("未找到 ffmpeg，无法编码为 OGG")
+        self.options = options
+        self.executor = ProcessPoolExecutor(max_workers=workers or max(1, (os.cpu_count() or 2) - 1),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        self.futures = []
+
+    def submit(self, path, callback=None):
+        """callback(path, result, error) 在进程池的回调线程中调用"""
+        future = self.executor.submit(process_file, path, **self.options)
+        if callback is not None:
+            def done(f):
+                error = f.exception()
+                callback(path, None if error else f.result(), error)
+            future.add_done_callback(done)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        """等待全部任务结束，返回 (成功数, 失败数)"""
+        self.executor.shutdown(wait=True)
+        failed = sum(1 for future in self.futures if future.exception() is not None)
+        return len(self.futures) - failed, failed
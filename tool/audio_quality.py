@@ -0,0 +1,109 @@
+import io
+import os
+import json
+import wave
+
+import numpy as np
+
+
+# 可在项目根目录的 quality.json 中覆盖任意一项
+QUALITY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "quality.json")
+DEFAULT_THRESHOLDS = {
+    "min_duration": 0.3,        # 秒
+    "min_sec_per_char": 0.05,   # 低于此值多半是截断
+    "max_sec_per_char": 0.6,    # 高于此值（加上 length_slack）多半是复读、拖长
+    "length_slack": 1.0,        # 秒，给语气词、短句留余量
+    "max_silence_ratio": 0.5,   # 静音帧占比
+    "max_clip_ratio": 0.001,    # 削波样本占比
+    "min_rms_db": -35.0,        # 整体音量（dBFS）
+}
+SILENCE_DB = -40.0
+FRAME_SECONDS = 0.02
+
+
+def load_thresholds(path=QUALITY_PATH):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            thresholds.update(json.load(f))
+    return thresholds
+
+
+def count_chars(text):
+    """只计文字（汉字、假名、字母、数字），不计标点和空白"""
+    return sum(1 for c in text if c.isalnum())
+
+
+def analyze_wav(source, text=""):
+    """
+    计算一条语音的质量指标
+
+    Args:
+        source: WAV 字节或文件路径
+        text: 对应的台词，用于计算每字时长
+    Returns:
+        dict：duration、sec_per_char、silence_ratio、clip_ratio、rms_db、peak_db；
+        不是 16 位 PCM 时返回 None
+    """
+    with wave.open(io.BytesIO(source) if isinstance(source, bytes) else source, "rb") as reader:
+        params = reader.getparams()
+        frames = reader.readframes(reader.getnframes())
+    if params.sampwidth != 2:
+        return None
+
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, params.nchannels)
+    samples = samples.astype(np.float32).mean(axis=1) / 32768.0
+    duration = len(samples) / params.framerate
+    chars = count_chars(text)
+
+    frame = max(1, int(params.framerate * FRAME_SECONDS))
+    count = len(samples) // frame
+    if count:
+        energy = np.mean(samples[:count * frame].reshape(count, frame) ** 2, axis=1)
+        silence_ratio = float(np.mean(energy < 10 ** (SILENCE_DB / 10)))
+    else:
+        silence_ratio = 1.0
+
+    # 全静音时按 -120dB 计，避免出现 -inf
+    magnitude = np.abs(samples)
+    rms_db = float(10 * np.log10(np.mean(samples ** 2) + 1e-12)) if len(samples) else -120.0
+    peak_db = float(20 * np.log10(magnitude.max() + 1e-6)) if len(samples) else -120.0
+
+    return {
+        "duration": round(duration, 3),
+        "chars": chars,
+        "sec_per_char": round(duration / chars, 3) if chars else None,
+        "silence_ratio": round(silence_ratio, 3),
+        "clip_ratio": round(float(np.mean(magnitude >= 0.999)), 5) if len(samples) else 0.0,
+        "rms_db": round(rms_db, 1),
+        "peak_db": round(peak_db, 1),
+    }
+
+
+def check_quality(metrics, thresholds=None):
+    """返回未通过的项（中文说明列表），全部通过时为空列表"""
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    if metrics is None:
+        return []
+    problems = []
+    duration = metrics["duration"]
+    chars = metrics["chars"]
+    if duration < thresholds["min_duration"]:
+        problems.append(f"时长过短 {duration:.2f}s")
+    elif chars and duration < chars * thresholds["min_sec_per_char"]:
+        problems.append(f"疑似截断（{metrics['sec_per_char']:.2f}s/字）")
+    if chars and duration > chars * thresholds["max_sec_per_char"] + thresholds["length_slack"]:
+        problems.append(f"时长异常（{duration:.1f}s / {chars} 字）")
+    if metrics["silence_ratio"] > thresholds["max_silence_ratio"]:
+        problems.append(f"静音过多 {metrics['silence_ratio']:.0%}")
+    if metrics["clip_ratio"] > thresholds["max_clip_ratio"]:
+        problems.append(f"削波 {metrics['clip_ratio']:.2%}")
+    if metrics["rms_db"] < thresholds["min_rms_db"]:
+        problems.append(f"音量过低 {metrics['rms_db']:.0f}dB")
+    return problems
+
+
+def inspect(source, text, thresholds=None):
+    """analyze_wav + check_quality，返回 (metrics, problems)"""
+    metrics = analyze_wav(source, text)
+    return metrics, check_quality(metrics, thresholds)
@@ -0,0 +1,436 @@
+"""
+启动并守护 GPT-SoVITS API 实例：健康探测通过才算就绪，进程退出后自动重启，
+可按排队的台词数与空闲 CPU 核数增减实例
+
+配置为项目根目录的 supervisor.json（可选），示例：
+    {
+      "command": ["{python}", "api_v2.py", "-a", "{host}", "-p", "{port}",
+                  "-c", "GPT_SoVITS/configs/tts_infer.yaml"],
+      "cwd": "GPT-SoVITS-v4-20250422fix",
+      "base_port": 9865,
+      "instances": 1,
+      "max_instances": 3,
+      "lines_per_instance": 500,
+      "cores_per_instance": 4
+    }
+command 可以是列表或字符串（字符串经 shell 执行），{python} 在整合包中为自带的 runtime/python.exe，
+否则为 PATH 中的 python。没有配置文件时：Windows 整合包沿用 api.bat（端口固定，只能一个实例），
+其他情况运行 api_v2.py。
+
+用法（无界面守护，Ctrl+C 时停止全部实例）：
+    python tool/backend_supervisor.py -n 2
+"""
+import os
+import sys
+import json
+import math
+import time
+import signal
+import socket
+import argparse
+import threading
+import subprocess
+from urllib.parse import urlsplit
+
+import requests
+
+# 保证从项目根目录启动时也能导入同目录模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from retry_policy import HEALTH_PATH, PROBE_TIMEOUT, backoff_delay
+from tts_dispatcher import Backend
+from weights_state import get_weights_state
+
+
+PROJECT_ROOT = os.path.dirname(current_dir)
+SUPERVISOR_PATH = os.path.join(PROJECT_ROOT, "supervisor.json")
+LOG_DIR = os.path.join(PROJECT_ROOT, "logs")  # 各实例的输出，Windows 上另开控制台窗口时不使用
+DEFAULT_SOVITS_DIR = "GPT-SoVITS-v4-20250422fix"
+POLL_INTERVAL = 2.0  # 秒，检查各实例状态的间隔
+RESTART_MAX_DELAY = 60.0
+MAX_RESTARTS = 5  # 连续这么多次启动都没能就绪，放弃该实例
+STOP_TIMEOUT = 10
+PORT_SCAN = 64  # 从 base_port 起最多尝试这么多个端口
+
+DEFAULTS = {
+    "command": None,
+    "cwd": None,  # 默认为 SOVITS_DIR
+    "host": "127.0.0.1",
+    "base_port": 9865,
+    "instances": 1,  # 启动时的实例数
+    "min_instances": None,  # 默认与 instances 相同
+    "max_instances": None,
+    "lines_per_instance": 500,  # 排队的台词每多这么多条，多开一个实例
+    "cores_per_instance": 4,  # 空闲核数不足时不再增开
+    "ready_timeout": 600,  # 秒，启动后这么久仍未就绪视为失败并重启
+    "max_inflight": 1,
+    "console": None,  # 是否另开控制台窗口显示输出，默认只在 Windows 上开启
+    "env": {},
+}
+
+
+def load_config(path=SUPERVISOR_PATH):
+    """读取 supervisor.json 并补全默认值，不存在时全部使用默认值"""
+    config = dict(DEFAULTS)
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+
+    cwd = config["cwd"] or os.getenv("SOVITS_DIR", DEFAULT_SOVITS_DIR)
+    config["cwd"] = os.path.abspath(os.path.join(PROJECT_ROOT, cwd))
+    api_bat = os.path.join(config["cwd"], "api.bat")
+    if not config["command"]:
+        if os.name == "nt" and os.path.exists(api_bat):
+            config["command"] = ["cmd", "/c", api_bat]
+            config["max_instances"] = 1  # api.bat 中的端口是固定的
+        else:
+            config["command"] = ["{python}", "api_v2.py", "-a", "{host}", "-p", "{port}"]
+    # 控制台窗口只在 Windows 上可用
+    config["console"] = os.name == "nt" and config["console"] is not False
+
+    if config["min_instances"] is None:
+        config["min_instances"] = config["instances"]
+    if config["max_instances"] is None:
+        config["max_instances"] = config["instances"]
+    config["min_instances"] = min(config["min_instances"], config["instances"])
+    config["max_instances"] = max(config["max_instances"], config["min_instances"])
+    return config
+
+
+def port_in_use(host, port):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.settimeout(1)
+        return s.connect_ex((host, port)) == 0
+
+
+def probe(base_url):
+    """健康探测：服务已加载完毕，能正常响应"""
+    try:
+        return requests.get(base_url + HEALTH_PATH, timeout=PROBE_TIMEOUT).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+def free_cores():
+    """空闲 CPU 核数：总核数减去最近 1 分钟的平均负载；Windows 没有负载信息，返回总核数"""
+    total = os.cpu_count() or 1
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return total
+    return max(0.0, total - load)
+
+
+class BackendProcess:
+    """
+    一个 API 实例
+
+    adopted 表示启动前端口上已有可用的服务（如另一个程序启动的），只使用、不重启也不停止。
+    """
+
+    def __init__(self, config, port, adopted=False):
+        self.config = config
+        self.port = port
+        self.url = f"http://{config['host']}:{port}"
+        self.adopted = adopted
+        self.ready = adopted
+        self.failed = False  # 连续启动失败，已放弃
+        self.process = None
+        self.started_at = 0.0
+        self.next_start = 0.0  # 退出后等待重启的时间点
+        self.restarts = 0
+        self.backend = None
+
+    def __repr__(self):
+        return f"BackendProcess({self.url})"
+
+    @property
+    def log_path(self):
+        return os.path.join(LOG_DIR, f"api-{self.port}.log")
+
+    def command(self):
+        runtime = os.path.join(self.config["cwd"], "runtime", "python.exe")
+        values = {"python": runtime if os.path.exists(runtime) else "python",
+                  "host": self.config["host"], "port": self.port}
+        command = self.config["command"]
+        if isinstance(command, str):
+            return command.format(**values)
+        return [str(part).format(**values) for part in command]
+
+    def start(self):
+        command = self.command()
+        env = dict(os.environ, **{key: str(value) for key, value in self.config["env"].items()})
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = (subprocess.CREATE_NEW_CONSOLE if self.config["console"]
+                                       else subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            kwargs["start_new_session"] = True  # 停止时连同它启动的子进程一起结束
+        if not self.config["console"]:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            kwargs["stdout"] = open(self.log_path, "ab")
+            kwargs["stderr"] = subprocess.STDOUT
+        try:
+            self.process = subprocess.Popen(command, cwd=self.config["cwd"], env=env,
+                                            shell=isinstance(command, str), **kwargs)
+        finally:
+            if "stdout" in kwargs:
+                kwargs["stdout"].close()  # 子进程持有自己的句柄
+        self.ready = False
+        self.started_at = time.monotonic()
+        get_weights_state(self.url).invalidate()  # 新启动的服务端只有默认权重
+
+    def stop(self):
+        if self.adopted or self.process is None:
+            return
+        process, self.process = self.process, None
+        self.ready = False
+        if process.poll() is not None:
+            return
+        try:
+            if os.name == "nt":
+                subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], capture_output=True)
+            else:
+                os.killpg(process.pid, signal.SIGTERM)
+            process.wait(STOP_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+    def get_backend(self):
+        if self.backend is None:
+            self.backend = Backend(self.url, max_inflight=self.config["max_inflight"])
+        return self.backend
+
+
+class BackendSupervisor:
+    """
+    管理一组 API 实例：按需启动、等待就绪、退出后按退避间隔重启
+
+    log(message) 报告状态变化；on_ready(backend) 在实例就绪时由监视线程调用，
+    调用方据此把新实例交给调度器（见 TTSDispatcher.add_backend）。
+    """
+
+    def __init__(self, config=None, log=print):
+        self.config = config or load_config()
+        self.log = log
+        self.on_ready = None
+        self.instances = []
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self, count=None):
+        """启动到 count 个实例（默认为配置中的 instances），不等待就绪"""
+        self.scale_to(self.config["instances"] if count is None else count)
+
+    def backends(self):
+        """已就绪实例的 Backend"""
+        with self.cond:
+            return [instance.get_backend() for instance in self.instances if instance.ready]
+
+    def wait_ready(self, timeout=None):
+        """
+        等待全部实例就绪（或被放弃），返回已就绪实例的 Backend
+
+        timeout 默认为配置中的 ready_timeout。
+        """
+        deadline = time.monotonic() + (self.config["ready_timeout"] if timeout is None else timeout)
+        with self.cond:
+            while any(not instance.ready and not instance.failed for instance in self.instances):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+        return self.backends()
+
+    def wanted(self, queue_depth, current):
+        """排队 queue_depth 条时应有的实例数；增开受空闲核数限制（正在启动的实例按已占用计算）"""
+        wanted = math.ceil(queue_depth / self.config["lines_per_instance"])
+        wanted = min(self.config["max_instances"], max(self.config["min_instances"], wanted))
+        if wanted > current:
+            with self.cond:
+                starting = sum(1 for instance in self.instances if not instance.ready and not instance.failed)
+            affordable = int(free_cores() // self.config["cores_per_instance"]) - starting
+            wanted = min(wanted, current + max(0, affordable))
+        return wanted
+
+    def autoscale(self, queue_depth, reserved=()):
+        """
+        按排队条数增减实例，返回增开的数量（负数为减少）
+
+        reserved 为调用方已在使用的其他实例地址，计入实例数，其端口不会被占用。
+        """
+        reserved_ports = {urlsplit(url).port for url in reserved}
+        with self.cond:
+            current = sum(1 for instance in self.instances
+                          if not instance.failed and instance.port not in reserved_ports)
+        count = self.wanted(queue_depth, current + len(reserved_ports)) - len(reserved_ports)
+        return self.scale_to(max(0, count), reserved_ports)
+
+    def scale_to(self, count, reserved_ports=()):
+        """增减到 count 个实例（不含 reserved_ports），返回变化的数量"""
+        with self.cond:
+            self.instances = [instance for instance in self.instances
+                              if not instance.failed and instance.port not in reserved_ports]
+            added = 0
+            while len(self.instances) < count and self._add_instance(reserved_ports) is not None:
+                added += 1
+            # 减少时先停启动中的，再停端口靠后的；已有的外部服务只是不再使用
+            ordered = sorted(self.instances, key=lambda i: (i.ready, i.port), reverse=True)
+            surplus = ordered[:max(0, len(self.instances) - count)]
+            for instance in surplus:
+                self.instances.remove(instance)
+            self.cond.notify_all()
+        for instance in surplus:
+            instance.stop()
+            if not instance.adopted:
+                self.log(f"⏹️ 已停止 API 实例 {instance.url}")
+        if added and self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._monitor, daemon=True)
+            self.thread.start()
+        return added - len(surplus)
+
+    def _add_instance(self, reserved_ports):
+        """在下一个空闲端口上启动实例；端口上已有可用的服务时直接使用（调用方持有 self.cond）"""
+        host = self.config["host"]
+        used = {instance.port for instance in self.instances} | set(reserved_ports)
+        for port in range(self.config["base_port"], self.config["base_port"] + PORT_SCAN):
+            if port in used:
+                continue
+            if port_in_use(host, port):
+                url = f"http://{host}:{port}"
+                if not probe(url):
+                    continue  # 其他程序占用的端口
+                instance = BackendProcess(self.config, port, adopted=True)
+                self.instances.append(instance)
+                self.log(f"ℹ️ {url} 上已有可用的 API 服务，直接使用")
+                self._notify_ready(instance)
+                return instance
+            instance = BackendProcess(self.config, port)
+            try:
+                instance.start()
+            except OSError as e:
+                self.log(f"❌ API 实例启动失败：{e}")
+                return None
+            self.instances.append(instance)
+            where = "独立控制台窗口" if self.config["console"] else os.path.relpath(instance.log_path, PROJECT_ROOT)
+            self.log(f"🚀 正在启动 API 实例 {instance.url}（输出见 {where}），健康检查通过后开始使用")
+            return instance
+        self.log(f"❌ 端口 {self.config['base_port']} 起没有空闲端口")
+        return None
+
+    def _notify_ready(self, instance):
+        callback = self.on_ready
+        if callback is not None:
+            # 在新线程中调用，回调可以放心地获取调度器的锁
+            threading.Thread(target=callback, args=(instance.get_backend(),), daemon=True).start()
+
+    def _monitor(self):
+        while not self.stopped.wait(POLL_INTERVAL):
+            with self.cond:
+                instances = [instance for instance in self.instances if not instance.adopted and not instance.failed]
+            for instance in instances:
+                self._check(instance)
+
+    def _check(self, instance):
+        now = time.monotonic()
+        process = instance.process
+        if process is None:
+            if now < instance.next_start:
+                return
+            with self.cond:
+                if instance not in self.instances:
+                    return
+                try:
+                    instance.start()
+                except OSError as e:
+                    self.log(f"❌ API 实例 {instance.url} 重启失败：{e}")
+                    instance.next_start = now + RESTART_MAX_DELAY
+                    return
+            self.log(f"🔄 正在重启 API 实例 {instance.url}")
+            return
+
+        if process.poll() is not None:
+            self._restart(instance, f"进程已退出（返回码 {process.returncode}）")
+            return
+        if instance.ready:
+            return
+        if probe(instance.url):
+            self.log(f"✅ API 实例 {instance.url} 已就绪（启动用时 {now - instance.started_at:.0f}s）")
+            with self.cond:
+                if instance not in self.instances:
+                    return
+                instance.ready = True
+                instance.restarts = 0
+                self.cond.notify_all()
+            self._notify_ready(instance)
+        elif now - instance.started_at > self.config["ready_timeout"]:
+            self._restart(instance, f"{self.config['ready_timeout']}s 内未就绪")
+
+    def _restart(self, instance, reason):
+        with self.cond:
+            if instance not in self.instances:
+                return
+        instance.stop()
+        with self.cond:
+            instance.restarts += 1
+            if instance.restarts > MAX_RESTARTS:
+                instance.failed = True
+                self.cond.notify_all()
+                self.log(f"❌ API 实例 {instance.url} {reason}，已连续失败 {MAX_RESTARTS} 次，不再重启")
+                return
+            delay = backoff_delay(instance.restarts - 1, base=2.0, cap=RESTART_MAX_DELAY)
+            instance.next_start = time.monotonic() + delay
+        self.log(f"⚠️ API 实例 {instance.url} {reason}，{delay:.0f}s 后重启")
+
+    def stop(self):
+        """停止监视并结束本程序启动的全部实例"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.cond:
+            instances, self.instances = self.instances, []
+            self.cond.notify_all()
+        for instance in instances:
+            instance.stop()
+
+
+def load_supervisor(path=SUPERVISOR_PATH, log=print):
+    """配置了 supervisor.json 时返回 BackendSupervisor，否则为 None"""
+    if not path or not os.path.exists(path):
+        return None
+    return BackendSupervisor(load_config(path), log)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动并守护 GPT-SoVITS API 实例")
+    parser.add_argument("-n", "--instances", type=int, help="实例数，默认取配置文件")
+    parser.add_argument("--config", default=SUPERVISOR_PATH, help="配置文件路径")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.instances:
+        config["instances"] = config["min_instances"] = args.instances
+        config["max_instances"] = max(config["max_instances"], args.instances)
+    supervisor = BackendSupervisor(config, lambda message: print(message, flush=True))
+    try:
+        supervisor.start()
+        backends = supervisor.wait_ready()
+        print(f"已就绪 {len(backends)}/{len(supervisor.instances)} 个实例：{', '.join(b.base_url for b in backends)}",
+              flush=True)
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+紧凑任务格式（.cjsonl）：预设表 + 只引用预设编号的逐行记录
+
+普通 JSONL 每行都重复 prompt_text、prompt、ref_audio_path 和两个权重路径，
+紧凑格式把这些字段放进预设定义行，台词行只剩 {"p": 预设编号, "text": 台词}：
+
+    {"format":"sonic-jobs/1"}
+    {"def":0,"fields":{"character":"anon","preset":"anon_happy","text_lang":"all_ja",...}}
+    {"p":0,"text":"今天也要加油哦"}
+    {"p":0,"text":"诶？真的吗"}
+
+预设定义出现在第一次引用之前，因此可以边生成边写出，也可以逐行流式读取。
+台词行中除 p 以外的字段会覆盖预设中的同名字段。
+
+用法（把已有 JSONL 转换为紧凑格式）：
+    python tool/compact_jobs.py output/anon_test.jsonl
+    python tool/compact_jobs.py output/anon_test.jsonl -o output/anon_test.cjsonl
+"""
+import os
+import sys
+import json
+import argparse
+
+# 保证从项目根目录启动时也能导入同目录模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from jsonl_source import JsonlSource
+
+
+COMPACT_FORMAT = "sonic-jobs/1"
+COMPACT_SUFFIX = ".cjsonl"
+LINE_FIELDS = ("text",)  # 逐行保存的字段，其余字段归入预设
+RECORD_PREFIX = b'{"p":'  # 写出的台词行都以此开头，建立索引时不必解析
+
+
+class CompactJobSource(JsonlSource):
+    """按需读取紧凑格式，接口与 JsonlSource 相同，取出的每条都是完整的请求配置"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.presets = {}  # 预设编号 → 字段，建立索引或遍历时读入
+
+    def _scan(self, f):
+        position = 0
+        for line in f:
+            if line.startswith(RECORD_PREFIX):
+                yield position, line
+            elif line.strip():
+                entry = json.loads(line.decode("utf-8"))
+                if "def" in entry:
+                    self.presets[entry["def"]] = entry["fields"]
+                elif "format" in entry:
+                    if entry["format"] != COMPACT_FORMAT:
+                        raise ValueError(f"不支持的任务格式 {entry['format']}")
+                else:
+                    yield position, line
+            position += len(line)
+
+    def _parse(self, line, index):
+        record = super()._parse(line, index)
+        try:
+            fields = self.presets[record.pop("p")]
+        except KeyError:
+            raise ValueError(f"第 {index + 1} 条引用了未定义的预设") from None
+        data = dict(fields)
+        data.update(record)
+        return data
+
+
+class CompactJobWriter:
+    """逐条写出紧凑格式：新出现的字段组合先写一行预设定义；写到临时文件，关闭时再改名"""
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + ".tmp"
+        self.file = open(self.temp_path, "w", encoding="utf-8")
+        self.presets = {}  # 规范化的字段 JSON → 预设编号
+        self.count = 0
+        self._write({"format": COMPACT_FORMAT})
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def write(self, config):
+        fields = {key: value for key, value in config.items() if key not in LINE_FIELDS}
+        key = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+        preset_id = self.presets.get(key)
+        if preset_id is None:
+            preset_id = self.presets[key] = len(self.presets)
+            self._write({"def": preset_id, "fields": fields})
+        record = {"p": preset_id}
+        record.update({key: config[key] for key in LINE_FIELDS if key in config})
+        self._write(record)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_jobs(configs, output_path, compact=False):
+    """写出推理用任务文件（compact 为 True 时用紧凑格式），返回条数"""
+    if compact:
+        with CompactJobWriter(output_path) as writer:
+            for config in configs:
+                writer.write(config)
+        return writer.count
+
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f_out:
+        for config in configs:
+            f_out.write(json.dumps(config, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def is_compact(path):
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                return line.lstrip().startswith(b'{"format"')
+    return False
+
+
+def open_job_source(path):
+    """按文件内容选择 CompactJobSource 或 JsonlSource"""
+    return CompactJobSource(path) if is_compact(path) else JsonlSource(path)
+
+
+def convert_jsonl(jsonl_path, output_path=None):
+    """把普通 JSONL 流式转换为紧凑格式，返回 (输出路径, 条数, 预设数)"""
+    output_path = output_path or os.path.splitext(jsonl_path)[0] + COMPACT_SUFFIX
+    with CompactJobWriter(output_path) as writer:
+        for config in JsonlSource(jsonl_path):
+            writer.write(config)
+    return output_path, writer.count, len(writer.presets)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把推理用 JSONL 转换为紧凑任务格式")
+    parser.add_argument("jsonl", help="输入 JSONL 文件")
+    parser.add_argument("-o", "--output", help=f"输出路径，默认同名 {COMPACT_SUFFIX}")
+    args = parser.parse_args(argv)
+
+    output_path, count, presets = convert_jsonl(args.jsonl, args.output)
+    before, after = os.path.getsize(args.jsonl), os.path.getsize(output_path)
+    print(f"✅ {count} 条，{presets} 个预设 → {output_path}")
+    print(f"   {before / 1024:.1f} KB → {after / 1024:.1f} KB（{before / max(after, 1):.1f} 倍）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,39 @@
 import requests
-import json
 import os
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton,
-                             QFileDialog, QTreeWidget, QTreeWidgetItem, QMessageBox, QHBoxLayout)
+                             QFileDialog, QTreeView, QComboBox, QMessageBox, QHBoxLayout,
+                             QCheckBox, QAbstractItemView)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtWidgets import QProgressBar
 
 from pygame import mixer
 import time
-
-# 初始化 pygame.mixer
-mixer.init()
-
-# API 地址
-url = "http://127.0.0.1:9865/tts"
+import threading
+
+# 保证从项目根目录启动时也能导入同目录模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from vocal_jobs import (build_jobs, build_merged_jobs, merged_run_name, order_by_weights, count_weight_switches,
+                        base_name_from_path, split_base_name, payload_hash)
+from compact_jobs import open_job_source
+from jsonl_source import JsonlSource
+from tts_dispatcher import TTSDispatcher, load_backends
+from backend_supervisor import load_supervisor
+from tts_client import DEFAULT_API_BASE, WEIGHTS_TIMEOUT, get_client
+from synth_cache import SynthCache
+from run_manifest import RunManifest, atomic_write_bytes
+from tts_batching import bucket_jobs, split_batch_audio
+from audio_post import AudioPostProcessor
+from audio_quality import inspect, load_thresholds
+from run_telemetry import RunTelemetry, format_summary
+from latency_model import LatencyModel, MAX_TIMEOUT_RETRIES
+from retry_policy import (MAX_RETRIES, HEALTH_WAIT, PROBE_MAX_DELAY, BackendUnavailable, backoff_delay, retryable_error,
+                          retryable_status)
+from signal_batching import SignalCoalescer
+from audio_list_model import AudioListModel, AudioFilterProxy
 
 # 后台生成音频线程
 # class WorkerThread(QThread):
@@ -59,103 +78,556 @@ url = "http://127.0.0.1:9865/tts"
 #                 self.update_status.emit(f"第 {i + 1} 条错误: {str(e)}")
 #         self.update_status.emit("生成完成")
 class WorkerThread(QThread):
-    update_status = pyqtSignal(str)
-    add_audio = pyqtSignal(str)
+    # 以下信号由 SignalCoalescer 按时间合并后发出，而不是每条台词发一次
+    update_status = pyqtSignal(str)  # 只发出周期内最新的一条
+    add_audio = pyqtSignal(list)  # 周期内新生成文件的相对路径
     progress_changed = pyqtSignal(int)
+    flag_audio = pyqtSignal(list)  # [(相对路径, 未通过的质量检查项), ...]
 
-    def __init__(self, data_list, base_name, output_root, sleep_time=1):
+    def __init__(self, data_list, base_name, output_root, sleep_time=0, schedule="file", backends=None,
+                 cache=None, resume=False, streaming=False, batching=False, postprocess=None,
+                 quality=None, quality_retries=0, manifest=None, supervisor=None):
         super().__init__()
         self.data_list = data_list
         self.base_name = base_name  # 场景名
         self.output_root = output_root
-        self.last_weights = (None, None)
-        self.character_counters = {}  # 每个角色当前编号（无论是否成功，都会前进）
-        self.sleep_time = sleep_time
+        self.sleep_time = sleep_time  # 请求间的最小间隔；实际节奏由各后端的 AdaptivePacer 根据服务端信号调整
+        self.schedule = schedule  # "file": 按文件顺序；"weights": 按权重分组，减少模型切换
+        self.backends = backends or load_backends()  # 可用的 GPT-SoVITS 实例
+        self.supervisor = supervisor  # BackendSupervisor，排队较多时增开实例；为 None 时只用 backends
+        self.cache = cache  # SynthCache，为 None 时不使用缓存
+        self.resume = resume  # 断点续跑：跳过清单中已完成且文件完好的行
+        self.streaming = streaming  # 流式请求，边收边写入磁盘
+        self.batching = batching  # 短句合并为批量请求（batch_size > 1）
+        self.postprocess = postprocess  # 后处理选项（传给 audio_post.process_file），为 None 时不处理
+        self.post = None
+        self.quality = quality  # 质量检查阈值（audio_quality.load_thresholds），为 None 时只检查大小
+        self.quality_retries = quality_retries  # 未通过质量检查时重新排队的次数
+        self.flagged = 0
+        self.dispatcher = TTSDispatcher(self.backends)  # 运行中可插入优先任务（见 submit_priority）
+        self.telemetry = None  # 本次运行的逐行日志（run_telemetry.RunTelemetry）
+        self.latency_model = LatencyModel()  # 按预设估计用时，决定每条请求的超时；start_run 时读入以前的运行日志
+        # 运行清单，同时是输出文件 → 行号索引；与界面共用同一实例
+        self.manifest = manifest or RunManifest(output_root, base_name)
+        self.done = 0
+        self.done_lock = threading.Lock()
+        self.notify = SignalCoalescer()
+        self.notify.add_channel("audio", self.add_audio.emit, accumulate=True)
+        self.notify.add_channel("flag", self.flag_audio.emit, accumulate=True)
+        self.notify.add_channel("status", self.update_status.emit)
+        self.notify.add_channel("progress", self.progress_changed.emit)
+
+    def run(self):
+        self.notify.start()
+        try:
+            self.generate()
+        finally:
+            # generate() 无论从哪里返回（读取失败、没有可用的实例等），之后插入的重新生成任务都由界面另行处理
+            self.dispatcher.close()
+            # 不在运行时不占用任务文件的句柄（Windows 上会使重新生成该文件时的替换失败）
+            for source in self.job_sources():
+                if isinstance(source, JsonlSource):
+                    source.close()
+            self.notify.close()  # 剩余的通知在 finished 之前发出
+
+    def status(self, message):
+        self.notify.push("status", message)
+
+    def generate(self):
+        # ✅ 先按文件顺序分配编号（无论成功失败），再决定执行顺序，保证文件名与顺序生成一致
+        try:
+            jobs, skipped = self.collect_jobs()
+        except (OSError, ValueError) as e:
+            self.status(f"读取 JSONL 文件失败: {str(e)}")
+            return
+
+        if not self.start_run(self.base_name):
+            return
+        for label in skipped:
+            self.status(f"{label}警告：缺少 character 字段")
+            self.advance_progress()
+
+        # 运行清单：全新生成时重置，续跑时跳过已完成的行（编号仍按完整文件分配）
+        if self.resume:
+            total = len(jobs)
+            jobs = [job for job in jobs if not self.skip_completed(job)]
+            self.status(f"断点续跑：已完成 {total - len(jobs)} 条，剩余 {len(jobs)} 条")
+        else:
+            self.reset_manifests()
+
+        # ✅ 命中缓存的直接写出，不再发往后端（也就不会触发权重切换）
+        if self.cache is not None:
+            total = len(jobs)
+            jobs = [job for job in jobs if not self.materialize_cached(job)]
+            self.status(f"缓存命中 {total - len(jobs)} 条，需合成 {len(jobs)} 条")
+
+        if self.schedule == "weights":
+            loaded = self.backends[0].loaded if len(self.backends) == 1 else (None, None)
+            jobs = order_by_weights(jobs, loaded)
+            self.status(
+                f"按权重分组生成：共 {len(jobs)} 条，切换权重 {count_weight_switches(jobs, loaded)} 次")
+
+        # 同一预设的短句按长度分桶，合并为一次批量请求
+        if self.batching:
+            total = len(jobs)
+            jobs = bucket_jobs(jobs)
+            self.status(f"短句合并：{total} 条合并为 {len(jobs)} 个请求")
+
+        # 按预计用时分配到各实例，长句优先，使各实例大致同时完成（见 TTSDispatcher.plan）
+        if self.schedule == "weights":
+            self.dispatcher.cost = lambda job: self.latency_model.cost(job["data"])
+            self.dispatcher.switch_cost = self.latency_model.switch_cost()
+
+        for backend in self.backends:
+            backend.pacer.min_delay = self.sleep_time
+            backend.pacer.delay = max(backend.pacer.delay, self.sleep_time)
+
+        self.scale_backends(len(jobs))
+        try:
+            self.dispatcher.run(jobs, self.process_job, self.job_failed)
+        finally:
+            self.release_backends()
+        self.finish_run("全部生成完成")
 
+    def job_sources(self):
+        """本次运行按需读取的任务文件"""
+        return [self.data_list]
 
+    def collect_jobs(self):
+        """返回 (任务列表, 缺少 character 字段的行的说明)"""
+        jobs, skipped = build_jobs(self.data_list, self.base_name, self.output_root)
+        return jobs, [f"第 {i + 1} 条" for i in skipped]
 
-    def run(self):
+    def manifest_for(self, job):
+        return self.manifest
+
+    def reset_manifests(self):
+        self.manifest.reset()
+
+    def start_run(self, log_name):
+        """准备本次运行；没有任何实例在 HEALTH_WAIT 内就绪时返回 False"""
         os.makedirs(self.output_root, exist_ok=True)
+        # 刚启动、尚未加载完的实例先不参与分配（断路器断开），健康检查通过后才加入
+        waiting = [backend for backend in self.backends if not backend.probe()]
+        for backend in waiting:
+            backend.breaker.trip()
+            backend.state.invalidate()  # 服务端未运行或正在重启，就绪后只有默认权重
+            self.status(f"{backend.base_url} 尚未就绪，健康检查通过后加入")
+        if waiting:
+            deadline = time.monotonic() + HEALTH_WAIT
+            if len(waiting) == len(self.backends):
+                waiting = self.wait_ready(waiting, deadline, first=True)
+                if len(waiting) == len(self.backends):
+                    self.status(f"没有可用的 API 实例：{HEALTH_WAIT:.0f}s 内均未通过健康检查，已停止生成")
+                    return False
+            if waiting:
+                threading.Thread(target=self.wait_ready, args=(waiting, deadline), daemon=True).start()
+        self.latency_model = LatencyModel.from_telemetry(self.output_root)
+        self.telemetry = RunTelemetry(self.output_root, log_name)
+
+        # 后处理在独立进程池中与合成并行进行
+        if self.postprocess is not None:
+            try:
+                self.post = AudioPostProcessor(**self.postprocess)
+            except RuntimeError as e:
+                self.status(f"警告：后处理已关闭 {str(e)}")
+        return True
+
+    def wait_ready(self, waiting, deadline, first=False):
+        """
+        按退避间隔探测尚未就绪的实例，通过的恢复断路器并加入调度（见 backend_ready）
+
+        first 时有一个就绪即返回；到 deadline 或合成结束时停止。返回仍未就绪的实例。
+        """
+        waiting = list(waiting)
+        attempt = 0
+        while waiting and not self.dispatcher.closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if not first:
+                    urls = "、".join(backend.base_url for backend in waiting)
+                    self.status(f"{urls} {HEALTH_WAIT:.0f}s 内未就绪，不再等待")
+                break
+            time.sleep(min(remaining, backoff_delay(attempt, cap=PROBE_MAX_DELAY)))
+            attempt += 1
+            ready = [backend for backend in waiting if backend.probe()]
+            for backend in ready:
+                waiting.remove(backend)
+                backend.breaker.record_success()
+                self.status(f"{backend.base_url} 已就绪")
+                self.backend_ready(backend)
+            if ready and first:
+                break
+        return waiting
+
+    def finish_run(self, title):
+        """
+        等待后处理，再把结果汇总为一条多行状态发出
+
+        状态通道每个周期只保留最新一条，逐行发出时只有最后一行能显示。
+        """
+        lines = [title]
+        if self.flagged:
+            lines.append(f"质量检查未通过 {self.flagged} 条（已在列表中标红），续跑时会重新生成")
+
+        if self.post is not None:
+            self.status("合成结束，等待后处理完成...")
+            succeeded, failed = self.post.wait()
+            lines.append(f"后处理完成 {succeeded} 条，失败 {failed} 条")
+
+        # 按预设、按后端的延迟与 RTF 分位数
+        summary = self.telemetry.close()
+        lines.extend(format_summary(summary))
+        lines.append(f"运行日志已保存到 {os.path.relpath(self.telemetry.path, self.output_root)}")
+        self.status("\n".join(lines))
+
+    def scale_backends(self, queue_depth):
+        """按排队条数增开实例（见 backend_supervisor），就绪后加入调度并分走一部分任务"""
+        if self.supervisor is None:
+            return
+        self.supervisor.log = self.status
+        self.supervisor.on_ready = self.backend_ready
+        change = self.supervisor.autoscale(queue_depth, [backend.base_url for backend in self.backends])
+        if change > 0:
+            self.status(f"排队 {queue_depth} 条，增开 {change} 个 API 实例，就绪后分担任务")
+        for backend in self.supervisor.backends():  # 已在运行的实例（如上次保留的）
+            self.backend_ready(backend)
+
+    def backend_ready(self, backend):
+        backend.pacer.min_delay = self.sleep_time
+        backend.pacer.delay = max(backend.pacer.delay, self.sleep_time)
+        moved = self.dispatcher.add_backend(backend)
+        if moved:
+            self.status(f"{backend.base_url} 已就绪，分走排队中的 {moved} 条")
+
+    def release_backends(self):
+        """合成结束后减少到最少实例数"""
+        if self.supervisor is None:
+            return
+        self.supervisor.on_ready = None
+        self.supervisor.autoscale(0, [backend.base_url for backend in self.backends])
+        self.supervisor.log = print
 
-        for i, data in enumerate(self.data_list):
+    def submit_priority(self, jobs):
+        """把重新生成的任务插到队首；合成阶段已结束时返回 False"""
+        return self.dispatcher.submit(jobs, priority=True)
+
+    def advance_progress(self, job=None):
+        # 重新生成的任务不计入批量进度
+        if job is not None and job.get("regenerate"):
+            return
+        with self.done_lock:
+            self.done += 1
+            done = self.done
+        self.notify.push("progress", done)
+
+    def skip_completed(self, job):
+        if not self.manifest_for(job).is_complete(job):
+            return False
+        self.notify.push("audio", os.path.relpath(job["output_path"], self.output_root))
+        self.advance_progress()
+        return True
+
+    def materialize_cached(self, job):
+        job["cache_key"] = self.cache.key_for(job["data"])
+        os.makedirs(job["output_dir"], exist_ok=True)
+        if not self.cache.materialize(job["cache_key"], job["output_path"]):
+            return False
+        size = os.path.getsize(job["output_path"])
+        self.manifest_for(job).record(job, size, elapsed=0.0, cached=True)
+        self.telemetry.record(job, True, 0.0, size=size, audio=job["output_path"], cached=True)
+        self.submit_post(job)  # 缓存中保存的是未处理的原始音频
+        relative_path = os.path.relpath(job["output_path"], self.output_root)
+        self.notify.push("audio", relative_path)
+        self.advance_progress()
+        return True
+
+    def job_failed(self, job, error):
+        # 切换权重超时（实例卡住）时改派，连接错误等退避后重试，其他失败、异常或没有可用的实例时跳过该条
+        if isinstance(error, requests.Timeout) and self.retry_overdue(job, WEIGHTS_TIMEOUT):
+            return
+        if isinstance(error, requests.RequestException) and retryable_error(error):
+            backend = next(backend for backend in self.dispatcher.backends if backend.base_url == job["backend"])
+            if self.retry_failed(backend, job, f"切换权重失败 {str(error)}"):
+                return
+        if isinstance(error, BackendUnavailable):
+            self.status(f"第 {job['line'] + 1} 条跳过：{str(error)}")
+        elif isinstance(error, requests.RequestException):
+            self.status(f"第 {job['line'] + 1} 条警告：切换权重失败 {str(error)}")
+        else:
+            self.status(f"第 {job['line'] + 1} 条异常: {str(error)}")
+        for member in job.get("batch", [job]):
+            self.telemetry.record(member, False, error=str(error))
+            self.advance_progress(member)
+
+    def job_succeeded(self, job, size, latency, elapsed, ttfb=None, flags=None):
+        """latency 为请求本身的用时（不含节流等待与质量检查），用于更新用时估计；elapsed 为该条的总用时"""
+        relative_path = os.path.relpath(job["output_path"], self.output_root)
+        event = self.telemetry.record(job, True, latency, ttfb, size, job["output_path"], flags=flags,
+                                      batched=job.get("batched"), elapsed=round(elapsed, 3))
+        self.latency_model.observe(event["preset"], event["chars"], latency)
+        if job.get("switch_time"):
+            self.latency_model.observe_switch(job["switch_time"])
+        if flags:
+            # 未通过质量检查的结果照常写出供试听，但不进缓存，续跑时会重新生成
+            self.manifest_for(job).record(job, size, elapsed=round(elapsed, 3), flags=flags)
+            with self.done_lock:
+                self.flagged += 1
+            self.notify.push("audio", relative_path)
+            self.notify.push("flag", (relative_path, "；".join(flags)))
+            self.status(f"第 {job['line'] + 1} 条质量检查未通过：{'；'.join(flags)}")
+            return
+
+        self.manifest_for(job).record(job, size, elapsed=round(elapsed, 3))
+        if self.cache is not None:
+            self.cache.put_file(job.get("cache_key") or self.cache.key_for(job["data"]), job["output_path"])
+        self.submit_post(job)
+
+        self.notify.push("audio", relative_path)
+        if ttfb is not None:
+            self.status(f"已生成 {relative_path}（首包 {ttfb:.2f}s）")
+        else:
+            self.status(f"已生成 {relative_path}")
+
+    def check_quality(self, backend, job, source):
+        """
+        质量检查；未通过且还有重试次数时把任务重新排队并返回 None，
+        否则返回未通过的项（通过时为空列表）
+        """
+        if self.quality is None:
+            return []
+        _, problems = inspect(source, job["data"].get("text", ""), self.quality)
+        if not problems:
+            return []
+        attempt = job.get("attempt", 0)
+        if attempt >= self.quality_retries:
+            return problems
+        job["attempt"] = attempt + 1
+        self.status(
+            f"第 {job['line'] + 1} 条质量检查未通过（{'；'.join(problems)}），第 {attempt + 1} 次重新生成")
+        self.dispatcher.requeue(backend, job)
+        return None
+
+    def retry_overdue(self, job, timeout):
+        """请求超过预计用时仍未返回（已被取消）：改派到其他后端重试，次数用完时返回 False"""
+        timeouts = job.get("timeouts", 0)
+        if timeouts >= MAX_TIMEOUT_RETRIES:
+            return False
+        job["timeouts"] = timeouts + 1
+        target = self.dispatcher.reroute(job)
+        self.status(f"第 {job['line'] + 1} 条超过 {timeout:.0f}s 未返回，改由 {target.base_url} 重试")
+        return True
+
+    def retry_failed(self, backend, job, error):
+        """连接错误、5xx 等可重试的失败：退避后放回该实例队首，次数用完时返回 False"""
+        failures = job.get("errors", 0)
+        if failures >= MAX_RETRIES:
+            return False
+        job["errors"] = failures + 1
+        delay = backoff_delay(failures)
+        self.dispatcher.requeue(backend, job, delay)
+        if backend.breaker.is_open:
+            self.status(f"{backend.base_url} 连续请求失败，暂停该实例的队列，等待服务恢复")
+        else:
+            self.status(f"第 {job['line'] + 1} 条失败: {error}，{delay:.1f}s 后第 {failures + 1} 次重试")
+        return True
+
+    def submit_post(self, job):
+        if self.post is not None:
+            self.post.submit(job["output_path"], self.post_finished)
+
+    def post_finished(self, path, result, error):
+        if error is not None:
+            self.status(f"后处理失败 {os.path.relpath(path, self.output_root)}: {str(error)}")
+
+    def process_batch(self, backend, job):
+        """一次请求合成多条短句，再按分段静音拆回各自的文件；拆分失败时逐条重试"""
+        members = job["batch"]
+        # 调度信息记在批量任务上，分给各成员（切换权重的用时只算在第一条）
+        for member in members:
+            member["backend"] = job.get("backend")
+            member["queue_wait"] = job.get("queue_wait")
+            member["switch_time"] = 0.0
+        members[0]["switch_time"] = job.get("switch_time", 0.0)
+
+        data = job["data"]
+        timeout = self.latency_model.timeout_for(data, job.get("timeouts", 0))
+        start = time.monotonic()
+        pieces = None
+        try:
+            response = backend.tts(data, timeout=timeout)
+            pacing_wait = time.monotonic() - start - response.latency
+            if response.status_code == 200:
+                pieces = split_batch_audio(response.content, len(members))
+        except requests.Timeout as e:
+            if self.retry_overdue(job, timeout):
+                return
+            self.status(f"第 {job['line'] + 1} 条起的批量请求超时，改为逐条生成: {str(e)}")
+        except requests.RequestException as e:
+            self.status(f"第 {job['line'] + 1} 条起的批量请求失败，改为逐条生成: {str(e)}")
+
+        if pieces is None:
+            for member in members:
+                self.process_job(backend, member)
+            return
+
+        # 请求用时与总用时均摊到各成员，节流等待是各成员共同经历的，照原值记录
+        latency = response.latency / len(members)
+        elapsed = (time.monotonic() - start) / len(members)
+        for member, piece in zip(members, pieces):
+            member["batched"] = len(members)
+            member["pacing_wait"] = pacing_wait
+            requeued = False
+            received = time.monotonic()
             try:
-                character = data.get("character", "unknown")
-                if character == "unknown":
-                    self.update_status.emit(f"第 {i + 1} 条警告：缺少 character 字段")
-                    self.progress_changed.emit(i + 1)
+                flags = self.check_quality(backend, member, piece)
+                if flags is None:
+                    requeued = True  # 重新排队的成员单独合成
                     continue
+                os.makedirs(member["output_dir"], exist_ok=True)
+                atomic_write_bytes(member["output_path"], piece)
+                member["post_time"] = time.monotonic() - received
+                self.job_succeeded(member, len(piece), latency, elapsed + member["post_time"], flags=flags)
+            except Exception as e:
+                self.status(f"第 {member['line'] + 1} 条异常: {str(e)}")
+                self.telemetry.record(member, False, latency, error=str(e))
+            finally:
+                if not requeued:
+                    self.advance_progress()
+
+    def process_job(self, backend, job):
+        """在后端工作线程中生成一条语音（权重已由调度器切换好）"""
+        if "batch" in job:
+            self.process_batch(backend, job)
+            return
 
-                # ✅ 分配当前编号（无论成功失败）
-                if character not in self.character_counters:
-                    self.character_counters[character] = 1
-                else:
-                    self.character_counters[character] += 1
-                index_number = self.character_counters[character]
-
-                # 拆分 base_name 为角色与场景（例如 anon_test → anon, test）
-                if "_" in self.base_name:
-                    parts = self.base_name.split("_", 1)
-                    folder_character = parts[0]
-                    folder_scene = parts[1]
+        i = job["line"]
+        start = time.monotonic()
+        response = None
+        requeued = False
+        error = None  # 失败原因，写入运行日志
+        for key in ("pacing_wait", "post_time"):
+            job.pop(key, None)  # 重新排队的任务不沿用上一次的用时
+        try:
+            os.makedirs(job["output_dir"], exist_ok=True)
+            full_output_path = job["output_path"]
+            data = job["data"]
+
+            # 请求生成；超时按该预设以往的用时估计，卡住的请求尽早取消并改派
+            timeout = self.latency_model.timeout_for(data, job.get("timeouts", 0))
+            ttfb = None
+            try:
+                if self.streaming:
+                    # 边收边写，音频不在内存中整段保留
+                    response, ttfb, size = backend.tts_stream_to_file(data, full_output_path, timeout)
                 else:
-                    folder_character = character
-                    folder_scene = self.base_name
-
-                filename = f"{character}_{folder_scene}_{index_number:02d}.wav"
-                output_dir = os.path.join(self.output_root, folder_character, folder_scene)
-                # output_dir = os.path.join(self.output_root, character, self.base_name)
-                os.makedirs(output_dir, exist_ok=True)
-                full_output_path = os.path.join(output_dir, filename)
-
-                # 切换权重
-                gpt_weight = data.get("gpt_weight")
-                sovits_weight = data.get("sovits_weight")
-                if (gpt_weight, sovits_weight) != self.last_weights:
-                    try:
-                        if gpt_weight and gpt_weight != self.last_weights[0]:
-                            requests.get(f"http://127.0.0.1:9865/set_gpt_weights?weights_path={gpt_weight}", timeout=10)
-                        if sovits_weight and sovits_weight != self.last_weights[1]:
-                            requests.get(f"http://127.0.0.1:9865/set_sovits_weights?weights_path={sovits_weight}", timeout=10)
-                        self.last_weights = (gpt_weight, sovits_weight)
-                    except requests.RequestException as e:
-                        self.update_status.emit(f"第 {i + 1} 条警告：切换权重失败 {str(e)}")
-                        self.progress_changed.emit(i + 1)
-                        continue
-
-                # 请求生成
-                try:
-                    response = requests.post(url, json=data, timeout=600) ## 我不信一条语音十分钟跑不出来
-                except requests.RequestException as e:
-                    self.update_status.emit(f"第 {i + 1} 条错误: 网络请求失败 {str(e)}")
-                    self.progress_changed.emit(i + 1)
-                    continue
+                    response = backend.tts(data, timeout=timeout)
+                    size = len(response.content)
+            except requests.Timeout as e:
+                if self.retry_overdue(job, timeout):
+                    requeued = True
+                    return
+                error = f"超过 {timeout:.0f}s 未返回 {str(e)}"
+                self.status(f"第 {i + 1} 条错误: {error}")
+                return
+            except requests.RequestException as e:
+                if retryable_error(e) and self.retry_failed(backend, job, f"网络请求失败 {str(e)}"):
+                    requeued = True
+                    return
+                error = f"网络请求失败 {str(e)}"
+                self.status(f"第 {i + 1} 条错误: {error}")
+                return
+            received = time.monotonic()
+            job["pacing_wait"] = received - start - response.latency
+
+            if response.status_code != 200:
+                if retryable_status(response.status_code) and self.retry_failed(
+                        backend, job, f"{response.status_code} {response.text}"):
+                    requeued = True
+                    return
+                error = f"{response.status_code} {response.text}"
+                self.status(f"第 {i + 1} 条失败: {error}")
+                return
 
-                if response.status_code != 200:
-                    self.update_status.emit(f"第 {i + 1} 条失败: {response.status_code} {response.text}")
-                    self.progress_changed.emit(i + 1)
-                    continue
+            if size < 500:
+                if self.streaming and os.path.exists(full_output_path):
+                    os.remove(full_output_path)
+                error = "返回内容为空或无效"
+                self.status(f"第 {i + 1} 条错误: 返回内容为空或无效！")
+                return
 
-                if not response.content or len(response.content) < 500:
-                    self.update_status.emit(f"第 {i + 1} 条错误: 返回内容为空或无效！")
-                    self.progress_changed.emit(i + 1)
-                    continue
+            # 质量检查（截断、静音、削波、时长异常），需要时重新排队
+            flags = self.check_quality(backend, job, full_output_path if self.streaming else response.content)
+            if flags is None:
+                requeued = True
+                return
+
+            # 写入成功音频（临时文件 + 改名），再记入运行清单
+            if not self.streaming:
+                atomic_write_bytes(full_output_path, response.content)
+            job["post_time"] = time.monotonic() - received
+            self.job_succeeded(job, size, response.latency, time.monotonic() - start, ttfb, flags)
 
-                # 写入成功音频
-                with open(full_output_path, "wb") as f:
-                    f.write(response.content)
+        except Exception as e:
+            error = str(e)
+            self.status(f"第 {i + 1} 条异常: {str(e)}")
 
-                relative_path = os.path.relpath(full_output_path, self.output_root)
-                self.add_audio.emit(relative_path)
-                self.update_status.emit(f"已生成 {relative_path}")
+        finally:
+            if error is not None:
+                self.telemetry.record(job, False, getattr(response, "latency", None), error=error,
+                                      elapsed=round(time.monotonic() - start, 3))
+            if not requeued:
+                self.advance_progress(job)
 
-            except Exception as e:
-                self.update_status.emit(f"第 {i + 1} 条异常: {str(e)}")
 
-            self.progress_changed.emit(i + 1)
-            time.sleep(self.sleep_time)
 
-        self.update_status.emit("全部生成完成")
+class MergedWorkerThread(WorkerThread):
+    """
+    一次生成多个任务文件（如一章的全部场景）：全部台词统一按权重排序，
+    每组权重只加载一次；各文件的输出、编号与运行清单仍与单独生成时相同。
+    """
+
+    def __init__(self, sources, output_root, **kwargs):
+        """sources: [(data_list, base_name), ...]"""
+        base_names = [base_name for _, base_name in sources]
+        manifests = {base_name: RunManifest(output_root, base_name) for base_name in base_names}
+        super().__init__(None, merged_run_name(base_names), output_root,
+                         manifest=manifests[base_names[0]], **kwargs)
+        self.sources = sources
+        self.manifests = manifests  # 场景名 → 该文件的运行清单
+
+    def job_sources(self):
+        return [data_list for data_list, _ in self.sources]
+
+    def collect_jobs(self):
+        jobs, skipped = build_merged_jobs(self.sources, self.output_root)
+        self.status(f"合并 {len(self.sources)} 个文件，共 {len(jobs)} 条")
+        return jobs, [f"{base_name} 第 {i + 1} 条" for base_name, i in skipped]
+
+    def manifest_for(self, job):
+        return self.manifests[job["base_name"]]
 
+    def reset_manifests(self):
+        for manifest in self.manifests.values():
+            manifest.reset()
+
+
+class RegenerateThread(WorkerThread):
+    """
+    在后台重新生成选中的条目：不查缓存、不重置清单、不计入批量进度
+
+    运行中可继续用 submit_priority 追加任务。
+    """
+
+    def __init__(self, jobs, base_name, output_root, **kwargs):
+        super().__init__([], base_name, output_root, **kwargs)
+        self.jobs = jobs
+
+    def generate(self):
+        if not self.start_run(f"{self.base_name}-regen"):
+            return
+        self.dispatcher.run(self.jobs, self.process_job, self.job_failed)
+        self.finish_run("重新生成完成")
 
 
 # 主界面
@@ -165,12 +637,21 @@ class TTSApp(QMainWindow):
         self.setWindowTitle("TTS 音频生成器")
         self.setGeometry(100, 100, 600, 400)
 
+        # 在界面中初始化而不是导入时：后处理进程池以 spawn 方式启动，子进程会重新导入本模块
+        mixer.init()
+        self.api_client = get_client(DEFAULT_API_BASE)  # API 地址（共享 keep-alive 连接池）
+
         self.jsonl_file = ""
         self.output_root = ""
         self.base_name = ""
         self.character_name = ""
         self.scene_name = ""
         self.data_list = []
+        self.manifest = None  # 当前任务的运行清单（输出文件 → 行号索引）
+        self.backends = load_backends()  # 批量生成与重新生成共用，已加载的权重状态也随之共享
+        self.supervisor = load_supervisor()  # 配置了 supervisor.json 时按排队条数增开实例
+        self.worker = None
+        self.regen_worker = None  # 后台重新生成线程
 
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -188,14 +669,73 @@ class TTSApp(QMainWindow):
         self.select_output_btn.clicked.connect(self.select_output_directory)
         self.layout.addWidget(self.select_output_btn)
 
+        self.schedule_checkbox = QCheckBox("按权重分组生成（减少模型切换，文件名不变）")
+        self.schedule_checkbox.setChecked(True)
+        self.layout.addWidget(self.schedule_checkbox)
+
+        self.cache_checkbox = QCheckBox("使用合成缓存（参数完全相同的台词直接复用）")
+        self.cache_checkbox.setChecked(True)
+        self.layout.addWidget(self.cache_checkbox)
+
+        self.streaming_checkbox = QCheckBox("流式写入（边合成边落盘，降低长句内存占用）")
+        self.layout.addWidget(self.streaming_checkbox)
+
+        self.batching_checkbox = QCheckBox("短句合并请求（同一预设的短台词按长度分桶批量合成）")
+        self.layout.addWidget(self.batching_checkbox)
+
+        self.post_checkbox = QCheckBox("音频后处理（去除首尾静音、统一响度）")
+        self.layout.addWidget(self.post_checkbox)
+
+        self.encode_checkbox = QCheckBox("同时导出 OGG/Opus（需要 ffmpeg，体积约为 WAV 的十分之一）")
+        self.layout.addWidget(self.encode_checkbox)
+
+        self.quality_checkbox = QCheckBox("质量检查（截断、静音、削波、时长异常的语音标红）")
+        self.quality_checkbox.setChecked(True)
+        self.layout.addWidget(self.quality_checkbox)
+
+        self.requeue_checkbox = QCheckBox("未通过质量检查时自动重新生成（最多 2 次）")
+        self.layout.addWidget(self.requeue_checkbox)
+        self.synth_cache = None
+
         self.generate_btn = QPushButton("生成音频")
-        self.generate_btn.clicked.connect(self.start_generation)
+        self.generate_btn.clicked.connect(lambda: self.start_generation())
         self.layout.addWidget(self.generate_btn)
 
-        self.audio_list = QTreeWidget()
-        self.audio_list.setHeaderLabels(["已生成音频文件"])
+        self.resume_btn = QPushButton("继续上次生成（跳过已完成）")
+        self.resume_btn.clicked.connect(lambda: self.start_generation(resume=True))
+        self.layout.addWidget(self.resume_btn)
+
+        self.merge_btn = QPushButton("合并多个 JSONL 一起生成（整章每组权重只加载一次）")
+        self.merge_btn.clicked.connect(self.start_merged_generation)
+        self.layout.addWidget(self.merge_btn)
+
+        # 按角色、场景筛选已生成的音频
+        self.filter_layout = QHBoxLayout()
+        self.character_filter = QComboBox()
+        self.character_filter.addItem("全部角色", "")
+        self.character_filter.currentIndexChanged.connect(self.apply_audio_filter)
+        self.scene_filter = QComboBox()
+        self.scene_filter.addItem("全部场景", "")
+        self.scene_filter.currentIndexChanged.connect(self.apply_audio_filter)
+        self.filter_layout.addWidget(self.character_filter)
+        self.filter_layout.addWidget(self.scene_filter)
+        self.layout.addLayout(self.filter_layout)
+
+        # 模型/视图：只绘制可见行，几万条结果也能流畅滚动、排序
+        self.audio_model = AudioListModel(self)
+        self.audio_proxy = AudioFilterProxy(self)
+        self.audio_proxy.setSourceModel(self.audio_model)
+        self.audio_list = QTreeView()
+        self.audio_list.setModel(self.audio_proxy)
+        self.audio_list.setRootIsDecorated(False)
+        self.audio_list.setUniformRowHeights(True)
+        # 默认按生成顺序显示；点击表头再排序（排序状态下每批插入都要重新比较）
+        self.audio_list.header().setSortIndicator(-1, Qt.AscendingOrder)
+        self.audio_list.setSortingEnabled(True)
         self.audio_list.setColumnWidth(0, 400)
-        self.audio_list.itemSelectionChanged.connect(self.on_audio_select)
+        self.audio_list.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.audio_list.setSelectionMode(QAbstractItemView.ExtendedSelection)  # 可多选后批量重新生成
+        self.audio_list.selectionModel().selectionChanged.connect(self.on_audio_select)
         self.layout.addWidget(self.audio_list)
 
         self.button_layout = QHBoxLayout()
@@ -223,26 +763,33 @@ class TTSApp(QMainWindow):
         self.select_jsonl_btn.setObjectName("btn_select_jsonl")
         self.select_output_btn.setObjectName("btn_select_output")
         self.generate_btn.setObjectName("btn_generate_audio")
+        self.resume_btn.setObjectName("btn_resume")
         self.play_btn.setObjectName("btn_play")
         self.regenerate_btn.setObjectName("btn_regen")
         self.status_label.setObjectName("status_label")
         self.progress_bar.setObjectName("progress_bar")
         self.audio_list.setObjectName("audio_list")
+        self.character_filter.setObjectName("cmb_character_filter")
+        self.scene_filter.setObjectName("cmb_scene_filter")
+        self.schedule_checkbox.setObjectName("chk_schedule")
+        self.cache_checkbox.setObjectName("chk_cache")
+        self.streaming_checkbox.setObjectName("chk_streaming")
+        self.batching_checkbox.setObjectName("chk_batching")
+        self.post_checkbox.setObjectName("chk_postprocess")
+        self.encode_checkbox.setObjectName("chk_encode")
+        self.quality_checkbox.setObjectName("chk_quality")
+        self.requeue_checkbox.setObjectName("chk_requeue")
 
     def select_jsonl_file(self):
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         default_dir = os.path.join(project_root, "output")
         os.makedirs(default_dir, exist_ok=True)
 
-        file_path, _ = QFileDialog.getOpenFileName(self, "选择 JSONL 文件", default_dir, "JSONL Files (*.jsonl);;All Files (*)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择 JSONL 文件", default_dir, "JSONL Files (*.jsonl *.cjsonl);;All Files (*)")
         if file_path:
             self.jsonl_file = file_path
-            full_filename = os.path.basename(file_path)
-            self.base_name = os.path.splitext(full_filename)[0]
-
             # ✅ 自动移除语言后缀（如 _ja、_zh）
-            if self.base_name.endswith("_ja") or self.base_name.endswith("_zh"):
-                self.base_name = self.base_name.rsplit("_", 1)[0]
+            self.base_name = base_name_from_path(file_path)
 
             parts = self.base_name.split("_")
             self.character_name, self.scene_name = (parts + ["default"])[:2]
@@ -260,7 +807,7 @@ class TTSApp(QMainWindow):
         os.makedirs(default_dir, exist_ok=True)
 
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "选择场景 JSONL 文件", default_dir, "JSONL Files (*.jsonl);;All Files (*)"
+            self, "选择场景 JSONL 文件", default_dir, "JSONL Files (*.jsonl *.cjsonl);;All Files (*)"
         )
         if not file_path:
             return
@@ -281,18 +828,23 @@ class TTSApp(QMainWindow):
         os.makedirs(output_dir, exist_ok=True)
 
         try:
-            # 读取jsonl数据
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data_list = [json.loads(line.strip()) for line in f if line.strip()]
+            # 只建立行偏移索引（支持紧凑格式 .cjsonl），台词在生成时逐行读取
+            data_list = open_job_source(file_path)
 
             if not data_list:
                 QMessageBox.warning(self, "警告", "选中的 JSONL 文件为空或格式错误")
                 return
 
             # 启动后台线程生成音频
-            self.worker = WorkerThread(data_list, base_name, output_dir)
+            self.worker = WorkerThread(data_list, base_name, output_dir, schedule=self.current_schedule(),
+                                       backends=self.backends, supervisor=self.supervisor,
+                                       cache=self.current_cache(), streaming=self.streaming_checkbox.isChecked(),
+                                       batching=self.batching_checkbox.isChecked(),
+                                       postprocess=self.current_postprocess(),
+                                       quality=self.current_quality(), quality_retries=self.current_retries())
             self.worker.update_status.connect(self.update_status)
             self.worker.add_audio.connect(self.add_audio_to_list)
+            self.worker.flag_audio.connect(self.flag_audio_in_list)
             self.worker.finished.connect(self.generation_finished)
             self.worker.start()
 
@@ -307,16 +859,30 @@ class TTSApp(QMainWindow):
         if output_dir:
             self.output_root = output_dir
             self.output_label.setText(f"保存目录: {self.output_root}")
+            if self.data_list:
+                # 运行清单保存在保存目录下，换目录后按新目录重新载入
+                self.manifest = RunManifest(self.output_root, self.base_name)
+
+    def current_manifest(self):
+        """与当前保存目录一致的运行清单；不一致时返回 None，由生成线程按当前目录载入"""
+        if self.manifest is not None and self.manifest.output_root == self.output_root:
+            return self.manifest
+        return None
 
     def load_jsonl_data(self):
         try:
-            with open(self.jsonl_file, 'r', encoding='utf-8') as f:
-                self.data_list = [json.loads(line.strip()) for line in f if line.strip()]
+            if isinstance(self.data_list, JsonlSource):
+                self.data_list.close()
+            # 大文件也只保存行偏移索引，按行号读取时再解析
+            self.data_list = open_job_source(self.jsonl_file)
 
             # 如果有 character 字段，使用第一个的值覆盖 self.character_name
             if self.data_list and "character" in self.data_list[0]:
                 self.character_name = self.data_list[0]["character"]
 
+            # 载入上次运行的清单，重新生成时可直接定位行号
+            self.manifest = RunManifest(self.output_root, self.base_name)
+
             self.status_label.setText(f"状态: 已加载 {len(self.data_list)} 条数据")
             self.generate_btn.setEnabled(True)
         except Exception as e:
@@ -325,7 +891,7 @@ class TTSApp(QMainWindow):
             QMessageBox.critical(self, "错误", f"读取 JSONL 文件失败: {e}")
 
     def process_and_save(self, data, index):
-        response = requests.post(url, json=data)
+        response = self.api_client.tts(data)
         if response.status_code == 200:
             output_filename = os.path.join(self.output_dir, f"{self.base_name}_{index:02d}.wav")
             with open(output_filename, "wb") as f:
@@ -334,18 +900,33 @@ class TTSApp(QMainWindow):
         else:
             raise Exception(f"请求失败: {response.text}")
 
-    def start_generation(self):
+    def start_generation(self, resume=False):
+        # 先检查，确认能开始后才禁用按钮、清空列表
+        if self.regen_worker is not None and self.regen_worker.isRunning():
+            QMessageBox.warning(self, "警告", "请等待后台重新生成完成")
+            return
         if not self.jsonl_file or not self.output_root or not self.data_list:
             QMessageBox.warning(self, "警告", "请检查 JSONL 文件和保存目录")
             return
 
         self.generate_btn.setEnabled(False)
-        self.audio_list.clear()
-
-        self.worker = WorkerThread(self.data_list, self.base_name, self.output_root)
+        self.resume_btn.setEnabled(False)
+        self.clear_audio_list()
+
+        self.worker = WorkerThread(self.data_list, self.base_name, self.output_root, schedule=self.current_schedule(),
+                                   backends=self.backends, supervisor=self.supervisor,
+                                   cache=self.current_cache(), resume=resume,
+                                   streaming=self.streaming_checkbox.isChecked(),
+                                   batching=self.batching_checkbox.isChecked(),
+                                   postprocess=self.current_postprocess(),
+                                   quality=self.current_quality(), quality_retries=self.current_retries(),
+                                   manifest=self.current_manifest())
         self.worker.update_status.connect(self.update_status)
         self.worker.add_audio.connect(self.add_audio_to_list)
+        self.worker.flag_audio.connect(self.flag_audio_in_list)
         self.worker.finished.connect(lambda: self.generate_btn.setEnabled(True))
+        self.worker.finished.connect(lambda: self.resume_btn.setEnabled(True))
+        self.manifest = self.worker.manifest
         self.worker.start()
 
         self.progress_bar.setMaximum(len(self.data_list))
@@ -353,28 +934,138 @@ class TTSApp(QMainWindow):
         self.worker.progress_changed.connect(self.progress_bar.setValue)
 
 
+    def start_merged_generation(self):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        default_dir = os.path.join(project_root, "output")
+        os.makedirs(default_dir, exist_ok=True)
+
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "选择要合并生成的 JSONL 文件", default_dir, "JSONL Files (*.jsonl *.cjsonl);;All Files (*)")
+        if not file_paths:
+            return
+        if any(worker is not None and worker.isRunning() for worker in (self.worker, self.regen_worker)):
+            QMessageBox.warning(self, "警告", "请等待当前生成完成")
+            return
+
+        try:
+            sources = [(open_job_source(path), base_name_from_path(path)) for path in file_paths]
+            total = sum(len(data_list) for data_list, _ in sources)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"读取 JSONL 文件失败: {e}")
+            return
+
+        resume = QMessageBox.question(self, "合并生成", "是否跳过各文件上次已完成的行？",
+                                      QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes
+        output_root = self.output_root or default_dir
+
+        self.generate_btn.setEnabled(False)
+        self.resume_btn.setEnabled(False)
+        self.merge_btn.setEnabled(False)
+        self.clear_audio_list()
+
+        self.worker = MergedWorkerThread(sources, output_root, schedule=self.current_schedule(),
+                                         backends=self.backends, supervisor=self.supervisor,
+                                         cache=self.current_cache(), resume=resume,
+                                         streaming=self.streaming_checkbox.isChecked(),
+                                         batching=self.batching_checkbox.isChecked(),
+                                         postprocess=self.current_postprocess(),
+                                         quality=self.current_quality(), quality_retries=self.current_retries())
+        self.worker.update_status.connect(self.update_status)
+        self.worker.add_audio.connect(self.add_audio_to_list)
+        self.worker.flag_audio.connect(self.flag_audio_in_list)
+        self.worker.finished.connect(self.generation_finished)
+        self.worker.progress_changed.connect(self.progress_bar.setValue)
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(0)
+        self.worker.start()
+
+        self.status_label.setText(f"状态: 合并生成 {len(sources)} 个文件，共 {total} 条...")
+
+    def current_schedule(self):
+        return "weights" if self.schedule_checkbox.isChecked() else "file"
+
+    def current_cache(self):
+        if not self.cache_checkbox.isChecked():
+            return None
+        if self.synth_cache is None:
+            self.synth_cache = SynthCache()
+        return self.synth_cache
+
+    def current_postprocess(self):
+        enabled = self.post_checkbox.isChecked()
+        encode = "opus" if self.encode_checkbox.isChecked() else None
+        if not enabled and not encode:
+            return None
+        return {"trim": enabled, "normalize": enabled, "encode": encode}
+
+    def current_quality(self):
+        if not self.quality_checkbox.isChecked():
+            return None
+        try:
+            return load_thresholds()
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "警告", f"读取 quality.json 失败，使用默认阈值: {e}")
+            return load_thresholds(None)
+
+    def current_retries(self):
+        return 2 if self.quality_checkbox.isChecked() and self.requeue_checkbox.isChecked() else 0
+
     def update_status(self, status):
         self.status_label.setText(f"状态: {status}")
 
-    def add_audio_to_list(self, relative_path):
-        item = QTreeWidgetItem([relative_path])
-        self.audio_list.addTopLevelItem(item)
+    def add_audio_to_list(self, relative_paths):
+        # 重新生成的条目已在列表中，只清除之前的质量标记
+        if self.audio_model.add_paths(relative_paths):
+            self.update_filter_choices()
+
+    def flag_audio_in_list(self, items):
+        self.audio_model.flag_paths(items)
+
+    def clear_audio_list(self):
+        self.audio_model.clear()
+        self.update_filter_choices()
+
+    def update_filter_choices(self):
+        for combo, values in ((self.character_filter, self.audio_model.characters),
+                              (self.scene_filter, self.audio_model.scenes)):
+            current = combo.currentData()
+            combo.blockSignals(True)
+            while combo.count() > 1:
+                combo.removeItem(1)
+            for value in sorted(values):
+                combo.addItem(value, value)
+            index = combo.findData(current)
+            combo.setCurrentIndex(max(index, 0))
+            combo.blockSignals(False)
+        self.apply_audio_filter()
+
+    def apply_audio_filter(self):
+        self.audio_proxy.set_filter(self.character_filter.currentData() or "", self.scene_filter.currentData() or "")
+
+    def selected_audio_paths(self):
+        """选中行的相对路径（按列表中的显示顺序）"""
+        rows = self.audio_list.selectionModel().selectedRows()
+        rows.sort(key=lambda index: index.row())
+        return [self.audio_model.path_at(self.audio_proxy.mapToSource(index).row()) for index in rows]
 
     def generation_finished(self):
-        self.generate_btn.setEnabled(True)
+        self.merge_btn.setEnabled(True)
+        if self.regen_worker is None or not self.regen_worker.isRunning():
+            self.generate_btn.setEnabled(True)
+            self.resume_btn.setEnabled(True)
         self.progress_bar.setValue(self.progress_bar.maximum())
 
     def on_audio_select(self):
-        has_selection = bool(self.audio_list.selectedItems())
+        has_selection = self.audio_list.selectionModel().hasSelection()
         self.play_btn.setEnabled(has_selection)
         self.regenerate_btn.setEnabled(has_selection)
 
     def play_audio(self):
-        selected_items = self.audio_list.selectedItems()
-        if not selected_items:
+        selected_paths = self.selected_audio_paths()
+        if not selected_paths:
             return
 
-        relative_path = selected_items[0].text(0)
+        relative_path = selected_paths[0]
         audio_file = os.path.join(self.output_root, relative_path)
 
         if os.path.exists(audio_file):
@@ -382,79 +1073,124 @@ class TTSApp(QMainWindow):
                 mixer.music.stop()
             mixer.music.load(audio_file)
             mixer.music.play()
-            self.status_label.setText(f"状态: 正在播放 {relative_path}")
+            record = self.manifest.lookup(relative_path) if self.manifest else None
+            if record is not None:
+                self.status_label.setText(
+                    f"状态: 正在播放 {relative_path}（第 {record['line'] + 1} 行，合成用时 {record.get('elapsed', 0):.1f}s）")
+            else:
+                self.status_label.setText(f"状态: 正在播放 {relative_path}")
         else:
             QMessageBox.critical(self, "错误", "音频文件不存在")
 
-    def regenerate_audio(self):
-        selected_items = self.audio_list.selectedItems()
-        if not selected_items:
-            return
-
-        relative_path = selected_items[0].text(0)
-        filename = os.path.basename(relative_path)
+    def find_data_index(self, relative_path):
+        """由输出文件定位 JSONL 行号：优先查运行清单（O(1)），没有记录的旧文件再按文件名回退扫描"""
+        record = self.manifest.lookup(relative_path) if self.manifest else None
+        if record is not None and record["line"] < len(self.data_list) \
+                and record["hash"] == payload_hash(self.data_list[record["line"]]):
+            return record["line"]
+
+        # 回退：{角色}_{场景}_{序号}.wav，场景名中可能含下划线，序号取最后一段
+        stem = os.path.splitext(os.path.basename(relative_path))[0]
+        prefix, number = stem.rsplit("_", 1)
+        file_index = int(number)
+        character = prefix.split("_", 1)[0]
+        # 其他场景的文件（如合并生成的输出）不能按当前文件的编号定位
+        if prefix != f"{character}_{split_base_name(self.base_name, character)[1]}":
+            return None
 
-        # 解析角色名、场景名、序号
-        try:
-            name_parts = filename.replace(".wav", "").split("_")
-            character = name_parts[0]
-            scene = name_parts[1]
-            file_index = int(name_parts[2])  # 文件名中的序号（如23）
-            
-        except Exception:
-            QMessageBox.critical(self, "错误", "文件名解析失败，无法定位数据")
-            return
-
-        # 在data_list中找到对应角色的第N条数据
-        data_index = None
         character_count = 0
-        
         for i, data in enumerate(self.data_list):
             if data.get("character") == character:
                 character_count += 1
                 if character_count == file_index:
-                    data_index = i
-                    break
-        
-        if data_index is None:
-            QMessageBox.critical(self, "错误", f"未找到 {character} 角色的第 {file_index} 条数据")
+                    return i
+        return None
+
+    def regenerate_audio(self):
+        """把选中的条目放进后台队列重新生成；批量生成进行中时插到其队首优先处理"""
+        selected_paths = self.selected_audio_paths()
+        if not selected_paths:
+            return
+        if isinstance(self.data_list, JsonlSource) and self.data_list.changed():
+            # 行号与输出文件的对应关系已无法确认
+            QMessageBox.warning(self, "警告", "JSONL 文件在载入后已被修改，请重新选择该文件后再重新生成")
             return
 
-        self.status_label.setText(f"状态: 重新生成 {filename} (第{file_index}条数据)...")
-        try:
-            data = self.data_list[data_index]
-            
-            # 切换权重（与WorkerThread中的逻辑保持一致）
-            gpt_weight = data.get("gpt_weight")
-            sovits_weight = data.get("sovits_weight")
-            
-            if gpt_weight:
-                try:
-                    requests.get(f"http://127.0.0.1:9865/set_gpt_weights?weights_path={gpt_weight}", timeout=10)
-                    self.status_label.setText(f"状态: 已切换GPT权重到 {gpt_weight}")
-                except requests.RequestException as e:
-                    self.status_label.setText(f"状态: GPT权重切换失败 {str(e)}")
-            
-            if sovits_weight:
-                try:
-                    requests.get(f"http://127.0.0.1:9865/set_sovits_weights?weights_path={sovits_weight}", timeout=10)
-                    self.status_label.setText(f"状态: 已切换SoVITS权重到 {sovits_weight}")
-                except requests.RequestException as e:
-                    self.status_label.setText(f"状态: SoVITS权重切换失败 {str(e)}")
-            
-            # 发送TTS请求
-            full_output_path = os.path.join(self.output_root, relative_path)
-            response = requests.post(url, json=data, timeout=600)
+        jobs = []
+        missing = []
+        for relative_path in selected_paths:
+            try:
+                data_index = self.find_data_index(relative_path)
+            except ValueError:
+                data_index = None
+            if data_index is None:
+                missing.append(os.path.basename(relative_path))
+                continue
+            jobs.append(self.make_regenerate_job(data_index, relative_path))
+
+        if missing:
+            QMessageBox.warning(self, "警告", f"未找到以下文件对应的数据，已跳过：\n{chr(10).join(missing)}")
+        if not jobs:
+            return
 
-            if response.status_code == 200:
-                with open(full_output_path, "wb") as f:
-                    f.write(response.content)
-                self.status_label.setText(f"状态: {filename} 重新生成完成")
+        # 同一权重的放在一起，插队时也只切换一次
+        jobs = order_by_weights(jobs)
+        for worker in (self.worker, self.regen_worker):
+            if worker is not None and worker.isRunning() and worker.output_root == self.output_root \
+                    and worker.base_name == self.base_name and worker.submit_priority(jobs):
+                self.status_label.setText(f"状态: 已将 {len(jobs)} 条重新生成任务插到队列最前")
+                return
+
+        for worker in (self.worker, self.regen_worker):
+            if worker is None or not worker.isRunning():
+                continue
+            # 正在生成其他文件（如合并生成），两个调度器同时切换同一后端的权重会互相干扰；
+            # 同一文件但插队失败说明该任务还在准备（等待实例就绪）或正在收尾
+            if worker.output_root == self.output_root and worker.base_name == self.base_name:
+                QMessageBox.warning(self, "警告", "当前任务正在准备或收尾，请稍后再重新生成")
             else:
-                raise Exception(response.text)
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"重新生成失败: {e}")
+                QMessageBox.warning(self, "警告", "当前正在生成其他文件，请等待完成后再重新生成")
+            return
+
+        self.regen_worker = RegenerateThread(jobs, self.base_name, self.output_root, backends=self.backends,
+                                             cache=self.current_cache(), streaming=self.streaming_checkbox.isChecked(),
+                                             postprocess=self.current_postprocess(), quality=self.current_quality(),
+                                             quality_retries=self.current_retries(), manifest=self.current_manifest())
+        self.regen_worker.update_status.connect(self.update_status)
+        self.regen_worker.add_audio.connect(self.add_audio_to_list)
+        self.regen_worker.flag_audio.connect(self.flag_audio_in_list)
+        self.regen_worker.finished.connect(self.regeneration_finished)
+        self.manifest = self.regen_worker.manifest
+        # 重新生成与批量生成共用后端，期间不开始新的批量任务，避免两边同时切换权重
+        self.generate_btn.setEnabled(False)
+        self.resume_btn.setEnabled(False)
+        self.regen_worker.start()
+        self.status_label.setText(f"状态: 后台重新生成 {len(jobs)} 条...")
+
+    def make_regenerate_job(self, data_index, relative_path):
+        data = self.data_list[data_index]
+        output_path = os.path.join(self.output_root, relative_path)
+        return {
+            "line": data_index,
+            "data": data,
+            "character": data.get("character"),
+            "filename": os.path.basename(output_path),
+            "output_dir": os.path.dirname(output_path),
+            "output_path": output_path,
+            "weights": (data.get("gpt_weight"), data.get("sovits_weight")),
+            "regenerate": True,
+        }
+
+    def regeneration_finished(self):
+        if self.worker is None or not self.worker.isRunning():
+            self.generate_btn.setEnabled(True)
+            self.resume_btn.setEnabled(True)
 
+    def closeEvent(self, event):
+        # 为分担排队而增开的实例随本程序结束
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,121 @@
+import os
+import json
+import threading
+from array import array
+
+
+class SourceChangedError(ValueError):
+    """建立索引后文件被修改（重新生成、编辑或压缩），按原来的偏移会读到别的行"""
+
+
+class JsonlSource:
+    """
+    按需读取的 JSONL 任务源，内存占用与文件大小无关
+
+    只保存每条非空行的字节偏移（每行 8 字节），按行号随机读取时 seek 到对应位置再解析；
+    顺序遍历时逐行读取。行号与原先 [json.loads(line) for line in f if line.strip()] 的下标一致。
+
+    建立索引时记下文件大小与修改时间，按行号读取前核对，文件已变化时抛出 SourceChangedError；
+    开始新的运行前调用 refresh() 重新建立索引。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = None
+        self._signature = None  # 建立索引时的 (st_size, st_mtime_ns)
+        self._file = None
+        self._lock = threading.Lock()  # 各后端线程共用一个文件句柄
+
+    @property
+    def offsets(self):
+        """非空行的起始字节偏移，首次访问时扫描一遍文件建立"""
+        if self._offsets is None:
+            offsets = array("q")
+            with open(self.path, "rb") as f:
+                signature = self._stat(os.fstat(f.fileno()))
+                for position, _ in self._scan(f):
+                    offsets.append(position)
+            self._offsets, self._signature = offsets, signature
+        return self._offsets
+
+    @staticmethod
+    def _stat(st):
+        return st.st_size, st.st_mtime_ns
+
+    def changed(self):
+        """建立索引后文件是否被修改（含删除）"""
+        if self._offsets is None:
+            return False
+        try:
+            return self._stat(os.stat(self.path)) != self._signature
+        except OSError:
+            return True
+
+    def refresh(self):
+        """文件已变化时丢弃索引并关闭句柄，下次访问时重新建立；返回是否变化"""
+        if not self.changed():
+            return False
+        self.close()
+        self._offsets = None
+        return True
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        offset = self.offsets[index]  # 越界时抛出 IndexError，与列表一致
+        if self.changed():
+            raise SourceChangedError(f"{self.path} 在载入后已被修改，请重新载入")
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "rb")
+            self._file.seek(offset)
+            line = self._file.readline()
+        return self._parse(line, index)
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for index, (_, line) in enumerate(self._scan(f)):
+                yield self._parse(line, index)
+
+    def _scan(self, f):
+        """逐行产生任务行的 (字节偏移, 行内容)；子类可在此跳过并处理非任务行"""
+        position = 0
+        for line in f:
+            if line.strip():
+                yield position, line
+            position += len(line)
+
+    def _parse(self, line, index):
+        try:
+            return json.loads(line.decode("utf-8"))
+        except ValueError as e:
+            raise ValueError(f"第 {index + 1} 条不是有效的 JSON: {e}") from None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LazyJob(dict):
+    """
+    不保存请求内容的任务 dict：job["data"] 每次从 JsonlSource 按行号重新读取
+
+    大文件中每行的 prompt、prompt_text 等字段重复很多，排队中的任务只保留文件名、权重等元数据。
+    """
+
+    __slots__ = ("source",)
+
+    def __init__(self, source, fields):
+        super().__init__(fields)
+        self.source = source
+
+    def __missing__(self, key):
+        if key == "data":
+            return self.source[self["line"]]
+        raise KeyError(key)
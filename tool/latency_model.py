@@ -0,0 +1,134 @@
+import os
+import threading
+from collections import deque
+
+from tts_client import TTS_TIMEOUT
+from audio_quality import count_chars
+from run_telemetry import TELEMETRY_DIR, load_events, preset_of
+
+
+SAFETY_FACTOR = 3.0  # 超过预计用时这么多倍仍未返回，视为卡住
+MARGIN = 10.0  # 秒，吸收排队、冷启动等与字数无关的开销
+MIN_TIMEOUT = 20.0
+MIN_CHARS = 8  # 短句的用时主要是固定开销，按至少这么多字估计
+MIN_SAMPLES = 5  # 某个预设的记录少于这么多条时改用全部预设的记录
+MAX_SAMPLES = 200  # 每个预设只保留最近的记录，服务端换卡、换版本后能较快跟上
+PERCENTILE = 0.9
+HISTORY_FILES = 5  # 启动时读取最近几次运行日志
+MAX_TIMEOUT_RETRIES = 2  # 一条请求超时后最多改派重试几次
+NOMINAL_RATE = 0.05  # 秒/字，没有任何记录时排程用的估计（只影响与切换用时的比例）
+DEFAULT_STEPS = 8  # 采样步数，与 speechgen 的默认值一致
+SWITCH_COST = 5.0  # 秒，没有记录时估计的一次权重切换用时
+
+
+class LatencyModel:
+    """
+    按预设估计每字合成用时，由此得到每条请求的读取超时
+
+    记录来自以前的运行日志（run_telemetry）与本次运行中成功的请求；取每字用时的 p90，
+    超时 = 预计用时 × SAFETY_FACTOR + MARGIN。没有足够记录时退回固定的 TTS_TIMEOUT。
+    排程（cost、switch_cost）用中位数。
+    """
+
+    def __init__(self):
+        self.rates = {}  # 预设 → 最近的每字用时（秒/字）
+        self.all = deque(maxlen=MAX_SAMPLES * 5)
+        self.switches = deque(maxlen=MAX_SAMPLES)  # 最近的权重切换用时（秒）
+        self.medians = {}  # 预设（None 为全部）→ 每字用时中位数，有新记录时清空
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_telemetry(cls, output_root, files=HISTORY_FILES):
+        """读入 output_root 下最近几次运行日志"""
+        model = cls()
+        directory = os.path.join(output_root, TELEMETRY_DIR)
+        try:
+            paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")]
+        except OSError:
+            return model
+        paths.sort(key=os.path.getmtime)
+        for path in paths[-files:]:  # 从旧到新，较新的记录留在队列中
+            try:
+                events = load_events(path)
+            except (OSError, ValueError):
+                continue
+            for event in events:
+                # 旧日志没有 chars 字段，无法换算每字用时；没有 elapsed 字段的旧日志中 latency 含节流等待与质量检查
+                if event["ok"] and not event.get("cached") and event.get("latency") and event.get("chars") \
+                        and "elapsed" in event:
+                    model.observe(event["preset"], event["chars"], event["latency"])
+                if event.get("switch"):
+                    model.observe_switch(event["switch"])
+        return model
+
+    def __len__(self):
+        return len(self.all)
+
+    def observe(self, preset, chars, latency):
+        rate = latency / max(chars, MIN_CHARS)
+        with self.lock:
+            self.rates.setdefault(preset, deque(maxlen=MAX_SAMPLES)).append(rate)
+            self.all.append(rate)
+            self.medians.clear()
+
+    def observe_switch(self, seconds):
+        with self.lock:
+            self.switches.append(seconds)
+
+    def rate(self, preset, percentile=PERCENTILE, fallback=True):
+        """该预设每字用时的分位数；记录不足时用全部预设的记录（fallback），仍不足时为 None"""
+        with self.lock:
+            samples = self.rates.get(preset)
+            if (samples is None or len(samples) < MIN_SAMPLES) and fallback:
+                samples = self.all
+            if samples is None or len(samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+    def cost(self, data):
+        """
+        一条台词的预计用时（秒），供排程比较长短
+
+        即该预设的每字用时中位数（实时率 × 每字音频时长）× 字数；该预设没有记录时，
+        用全部记录（或 NOMINAL_RATE）按采样步数换算，约一半用时与步数成正比。
+        """
+        chars = max(count_chars(data.get("text", "")), MIN_CHARS)
+        rate = self.median(preset_of(data))
+        if rate is None:
+            steps = data.get("sample_steps") or DEFAULT_STEPS
+            rate = (self.median(None) or NOMINAL_RATE) * (1 + steps / DEFAULT_STEPS) / 2
+        return rate * chars
+
+    def median(self, preset):
+        """该预设（None 为全部预设）每字用时的中位数，记录不足时为 None；一次排程要估计大量台词，结果缓存"""
+        try:
+            return self.medians[preset]
+        except KeyError:
+            pass
+        rate = self.rate(preset, 0.5, fallback=preset is None)
+        self.medians[preset] = rate
+        return rate
+
+    def switch_cost(self):
+        """一次权重切换的预计用时（秒）"""
+        with self.lock:
+            ordered = sorted(self.switches)
+        return ordered[len(ordered) // 2] if ordered else SWITCH_COST
+
+    def predict(self, preset, chars):
+        """预计用时（秒），记录不足时为 None"""
+        rate = self.rate(preset)
+        return None if rate is None else rate * max(chars, MIN_CHARS)
+
+    def timeout_for(self, data, retries=0):
+        """
+        一条请求的读取超时（秒）
+
+        retries 为该条已经超时的次数，每次加倍，避免确实很长的台词反复被判为卡住。
+        """
+        predicted = self.predict(preset_of(data), count_chars(data.get("text", "")))
+        if predicted is None:
+            return TTS_TIMEOUT
+        timeout = (predicted * SAFETY_FACTOR + MARGIN) * 2 ** retries
+        return min(TTS_TIMEOUT, max(MIN_TIMEOUT, timeout))
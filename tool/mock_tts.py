@@ -0,0 +1,346 @@
+"""
+本地模拟 GPT-SoVITS api_v2，不需要 GPU 与模型文件，用于压测与复现吞吐问题
+
+实现 /tts、/set_gpt_weights、/set_sovits_weights（另有 /stats 返回计数），返回合成的正弦波 WAV。
+
+用法：
+    python tool/mock_tts.py --port 9865 --per-char 0.05 --switch-penalty 3 --error-rate 0.02
+    python tool/mock_tts.py --stall-rate 0.01 --stall-seconds 120
+    python tool/mock_tts.py --startup-delay 30     # 模拟加载模型，期间端口不可连接
+    python tool/mock_tts.py --trace output/.telemetry/anon_test-20250101-120000.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import struct
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+# 保证从项目根目录启动时也能导入同目录模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from audio_quality import count_chars
+from run_telemetry import load_events
+
+
+DEFAULT_PORT = 9865
+SAMPLE_RATE = 32000
+STREAM_CHUNK_SECONDS = 0.5
+
+
+def synth_wave(text, sec_per_char=0.2, sample_rate=SAMPLE_RATE, rng=None):
+    """按字数生成带音节起伏的正弦波（float32），时长约为 字数 × sec_per_char"""
+    rng = rng or np.random.default_rng()
+    duration = max(0.3, count_chars(text) * sec_per_char)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = rng.uniform(160, 260)
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * t / sec_per_char)) if sec_per_char > 0 else 1.0
+    return (0.3 * np.sin(2 * np.pi * pitch * t) * (0.3 + 0.7 * envelope)).astype(np.float32)
+
+
+def wav_header(sample_rate, data_bytes=None):
+    """16 位单声道 WAV 头；data_bytes 为 None 时写入占位长度（与服务端流式模式一致）"""
+    size = 0xFFFFFFFF - 36 if data_bytes is None else data_bytes
+    return (b"RIFF" + struct.pack("<I", (size + 36) & 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b"data" + struct.pack("<I", size))
+
+
+def to_pcm(samples):
+    return np.clip(np.round(samples * 32767), -32768, 32767).astype("<i2").tobytes()
+
+
+class LatencyTrace:
+    """
+    从运行日志（run_telemetry）回放延迟：按预设依次取出记录的 RTF，乘以合成音频的时长；
+    预设不在日志中时使用全部记录。权重切换耗时取日志中切换用时的平均值。
+    """
+
+    def __init__(self, path):
+        events = [e for e in load_events(path) if e["ok"] and not e.get("cached") and e.get("rtf")]
+        if not events:
+            raise ValueError(f"{path} 中没有可回放的记录")
+        self.by_preset = {}
+        for event in events:
+            self.by_preset.setdefault(event["preset"], deque()).append(event["rtf"])
+        self.all = deque(event["rtf"] for event in events)
+        switches = [e["switch"] for e in load_events(path) if e.get("switch")]
+        self.switch_penalty = sum(switches) / len(switches) if switches else None
+        self.lock = threading.Lock()
+
+    def rtf(self, preset):
+        with self.lock:
+            values = self.by_preset.get(preset) or self.all
+            value = values[0]
+            values.rotate(-1)
+            return value
+
+
+class MockState:
+    """模拟服务端状态：已加载的权重、单 GPU 串行推理（slots 个并发）与统计"""
+
+    def __init__(self, per_char=0.03, base_latency=0.2, jitter=0.1, switch_penalty=2.0, error_rate=0.0,
+                 drop_rate=0.0, stall_rate=0.0, stall_seconds=60.0, sec_per_char=0.2, slots=1, trace=None,
+                 seed=None):
+        self.per_char = per_char
+        self.base_latency = base_latency
+        self.jitter = jitter
+        self.switch_penalty = switch_penalty
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.sec_per_char = sec_per_char
+        self.trace = trace
+        if trace is not None and trace.switch_penalty is not None:
+            self.switch_penalty = trace.switch_penalty
+        self.gpu = threading.Semaphore(max(1, slots))
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        self.loaded = {"gpt": None, "sovits": None}
+        self.stats = {"tts": 0, "switches": 0, "errors": 0, "drops": 0, "stalls": 0, "busy_seconds": 0.0}
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def latency(self, data, audio_seconds):
+        if self.trace is not None:
+            return self.trace.rtf(data.get("preset") or data.get("character") or "default") * audio_seconds
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        return (self.base_latency + self.per_char * count_chars(data.get("text", ""))) * factor
+
+    def switch(self, kind, path):
+        with self.gpu:
+            if self.loaded[kind] == path:
+                return
+            time.sleep(self.switch_penalty)
+            self.loaded[kind] = path
+            self.count("switches")
+            self.count("busy_seconds", self.switch_penalty)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockGPTSoVITS/1.0"
+    disable_nagle_algorithm = True  # 头和正文分两次写出，不关 Nagle 会与延迟 ACK 叠加出 40ms 左右的等待
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if parts.path in ("/set_gpt_weights", "/set_sovits_weights"):
+            weights_path = params.get("weights_path")
+            if not weights_path:
+                self.send_json(400, {"message": "weights_path is required"})
+                return
+            self.state.switch("gpt" if parts.path == "/set_gpt_weights" else "sovits", weights_path)
+            self.send_json(200, {"message": "success"})
+        elif parts.path == "/tts":
+            self.handle_tts(params)
+        elif parts.path == "/stats":
+            with self.state.lock:
+                self.send_json(200, dict(self.state.stats, loaded=self.state.loaded))
+        elif parts.path == "/docs":
+            self.send_json(200, {"message": "mock"})
+        else:
+            self.send_json(404, {"message": "not found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/tts":
+            self.send_json(404, {"message": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"message": "invalid json"})
+            return
+        self.handle_tts(data)
+
+    def handle_tts(self, data):
+        state = self.state
+        if not data.get("text"):
+            self.send_json(400, {"message": "text is required"})
+            return
+        if data.get("media_type", "wav") != "wav":
+            self.send_json(400, {"message": "mock only supports media_type=wav"})
+            return
+        if state.roll(state.drop_rate):
+            state.count("drops")
+            self.close_connection = True
+            self.connection.close()
+            return
+        if state.roll(state.error_rate):
+            state.count("errors")
+            self.send_json(500, {"message": "tts failed", "Exception": "injected error"})
+            return
+
+        # cut0 只按换行切分：每行一段，段后补 fragment_interval 秒静音（与服务端的批量行为一致）
+        lines = data["text"].split("\n") if data.get("text_split_method") == "cut0" else [data["text"]]
+        gap = np.zeros(int(SAMPLE_RATE * float(data.get("fragment_interval", 0.3))), dtype=np.float32)
+        segments = []
+        for line in lines:
+            if line.strip():
+                segments.extend([synth_wave(line, state.sec_per_char, rng=state.rng), gap])
+        samples = np.concatenate(segments) if segments else gap
+        audio_seconds = len(samples) / SAMPLE_RATE
+        latency = state.latency(data, audio_seconds)
+        if state.roll(state.stall_rate):
+            # 推理卡住：占着 GPU 很久才返回，期间同一实例的其他请求只能排队
+            state.count("stalls")
+            latency += state.stall_seconds
+
+        with state.gpu:
+            state.count("tts")
+            state.count("busy_seconds", latency)
+            if data.get("streaming_mode"):
+                self.stream(samples, latency)
+                return
+            time.sleep(latency)
+
+        body = wav_header(SAMPLE_RATE, len(samples) * 2) + to_pcm(samples)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, samples, latency):
+        """分块返回：头部使用占位长度，合成时间按块平均分摊"""
+        chunk = int(SAMPLE_RATE * STREAM_CHUNK_SECONDS)
+        pieces = [samples[i:i + chunk] for i in range(0, len(samples), chunk)]
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, piece in enumerate(pieces):
+            time.sleep(latency / len(pieces))
+            payload = to_pcm(piece)
+            if index == 0:
+                payload = wav_header(SAMPLE_RATE) + payload
+            self.wfile.write(f"{len(payload):X}\r\n".encode("latin-1") + payload + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockTTSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, verbose=False, **options):
+        super().__init__((host, port), MockHandler)
+        self.state = MockState(**options)
+        self.verbose = verbose
+        self.thread = None
+        self.connections = set()  # 保持中的连接，stop() 时断开
+        self.connections_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中运行，返回 base_url（port=0 时自动分配端口）"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def handle_error(self, request, client_address):
+        # 客户端超时放弃请求或 stop() 断开连接属于正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self.connections_lock:
+            self.connections.discard(request)
+        super().shutdown_request(request)
+
+    def stop(self):
+        """停止服务并断开保持中的连接（与服务端进程退出时一致）"""
+        self.shutdown()
+        self.server_close()
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟 GPT-SoVITS API（无需 GPU 与模型）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--per-char", type=float, default=0.03, help="每个字的合成用时（秒）")
+    parser.add_argument("--base-latency", type=float, default=0.2, help="每个请求的固定开销（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="用时随机浮动比例")
+    parser.add_argument("--switch-penalty", type=float, default=2.0, help="切换一次权重的用时（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="直接断开连接的概率")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="推理卡住的概率")
+    parser.add_argument("--stall-seconds", type=float, default=60.0, help="卡住时额外占用的时间（秒）")
+    parser.add_argument("--sec-per-char", type=float, default=0.2, help="生成音频每个字的时长（秒）")
+    parser.add_argument("--slots", type=int, default=1, help="同时推理的请求数（模拟单卡串行时为 1）")
+    parser.add_argument("--trace", help="回放运行日志（.telemetry/*.jsonl）中记录的 RTF 与切换用时")
+    parser.add_argument("--seed", type=int, help="随机种子，便于复现")
+    parser.add_argument("--startup-delay", type=float, default=0.0, help="监听端口前等待的秒数（模拟加载模型）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每个请求")
+    args = parser.parse_args(argv)
+
+    time.sleep(args.startup_delay)
+    server = MockTTSServer(args.host, args.port, args.verbose,
+                           per_char=args.per_char, base_latency=args.base_latency, jitter=args.jitter,
+                           switch_penalty=args.switch_penalty, error_rate=args.error_rate,
+                           drop_rate=args.drop_rate, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+                           sec_per_char=args.sec_per_char, slots=args.slots,
+                           trace=LatencyTrace(args.trace) if args.trace else None, seed=args.seed)
+    print(f"模拟 GPT-SoVITS 已启动：{server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import time
+import random
+import threading
+
+import requests
+
+
+MAX_RETRIES = 4  # 一条台词因连接错误、5xx 失败后最多重新排队几次
+BASE_DELAY = 0.5  # 秒，第一次重试前的退避
+MAX_DELAY = 30.0
+PROBE_MAX_DELAY = 10.0  # 健康探测的最长间隔，服务恢复后最多这么久就能继续
+HEALTH_WAIT = 120.0  # 秒，断开后等待恢复的上限，超过后放弃该实例
+FAILURE_THRESHOLD = 3  # 连续这么多次失败后断开，暂停该实例的队列
+HEALTH_PATH = "/docs"  # api_v2 是 FastAPI 应用，服务可用时文档页返回 200
+PROBE_TIMEOUT = 5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def backoff_delay(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """
+    第 attempt 次（从 0 开始）重试前的等待（秒）
+
+    指数增长并有上限；一半固定、一半随机，同时失败的多条任务不会在同一时刻一起重试。
+    """
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retryable_status(status):
+    return status in RETRY_STATUS
+
+
+class BackendUnavailable(requests.ConnectionError):
+    """断路器断开后超过 HEALTH_WAIT 仍未通过健康检查"""
+
+
+def retryable_error(error):
+    """
+    连接错误（含连接超时）、传输中断和 5xx 可以重试
+
+    读取超时由调用方改派到其他实例；4xx 说明请求本身有问题，重试也不会成功；
+    已放弃等待的实例（BackendUnavailable）不再重试。
+    """
+    if isinstance(error, BackendUnavailable):
+        return False
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return retryable_status(error.response.status_code)
+    return isinstance(error, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError))
+
+
+class CircuitBreaker:
+    """
+    单个实例的断路器：连续 threshold 次失败后断开
+
+    断开期间调用方在 wait() 中暂停，其中一个调用方按退避间隔做健康探测，
+    探测成功后恢复，其余等待者一起继续。任何一次成功都会清零失败计数。
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.failures = 0
+        self.is_open = False
+        self.probing = False
+        self.cond = threading.Condition()
+
+    def record_success(self):
+        with self.cond:
+            self.failures = 0
+            if self.is_open:
+                self.is_open = False
+                self.cond.notify_all()
+
+    def record_failure(self):
+        """返回 True 表示本次失败使断路器断开"""
+        with self.cond:
+            self.failures += 1
+            if self.is_open or self.failures < self.threshold:
+                return False
+            self.is_open = True
+            return True
+
+    def trip(self):
+        """直接断开（如启动时实例尚未就绪），等待者在健康探测成功后才继续"""
+        with self.cond:
+            self.is_open = True
+
+    def wait(self, probe, timeout=HEALTH_WAIT):
+        """
+        断开时阻塞到 probe() 返回 True，超过 timeout 秒抛出 BackendUnavailable
+
+        Returns:
+            是否等待过（调用方可据此清除其他退避状态）
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            if not self.is_open:
+                return False
+            while self.is_open and self.probing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BackendUnavailable(f"{timeout:.0f}s 内未通过健康检查")
+                self.cond.wait(remaining)
+            if not self.is_open:
+                return True
+            self.probing = True
+
+        ok = False
+        attempt = 0
+        try:
+            while not ok:
+                ok = probe()
+                remaining = deadline - time.monotonic()
+                if not ok and remaining <= 0:
+                    raise BackendUnavailable(f"{timeout:.0f}s 内未通过健康检查")
+                if not ok:
+                    time.sleep(min(remaining, backoff_delay(attempt, cap=PROBE_MAX_DELAY)))
+                    attempt += 1
+        finally:
+            with self.cond:
+                self.probing = False
+                if ok:
+                    self.failures = 0
+                    self.is_open = False
+                self.cond.notify_all()
+        return True
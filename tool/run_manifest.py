@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import threading
+
+from vocal_jobs import payload_hash
+
+
+MANIFEST_DIR = ".manifest"
+
+
+def atomic_write_bytes(path, content):
+    """先写临时文件再改名，进程中途退出也不会留下半截音频"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def is_valid_wav(path, min_bytes=500):
+    """检查文件存在、大小合理且带有 RIFF/WAVE 头"""
+    try:
+        if os.path.getsize(path) < min_bytes:
+            return False
+        with open(path, "rb") as f:
+            header = f.read(12)
+    except OSError:
+        return False
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+class RunManifest:
+    """
+    记录一次生成任务中已完成的行（追加写入的 JSONL）
+
+    每完成一行追加一条 {"line", "path", "hash", "bytes", "time", "elapsed"}，
+    断点续跑时只跳过记录存在、请求内容未变、输出文件完好且未被质量检查标记（flags）的行。
+    records 同时是 输出文件 → 行号 的索引，重新生成与预览据此直接定位数据。
+    """
+
+    def __init__(self, output_root, base_name):
+        self.output_root = output_root
+        self.path = os.path.join(output_root, MANIFEST_DIR, f"{base_name}.jsonl")
+        self.records = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.records = {}
+        self.needs_newline = False
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self.needs_newline = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时最后一行可能只写了一半
+                self.records[record["path"]] = record
+
+    def reset(self):
+        """重新开始一次完整生成"""
+        with self.lock:
+            self.records = {}
+            self.needs_newline = False
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def relative_path(self, job):
+        return os.path.relpath(job["output_path"], self.output_root).replace(os.sep, "/")
+
+    def lookup(self, relative_path):
+        """按输出文件的相对路径查找记录（行号、请求哈希、用时），O(1)"""
+        return self.records.get(relative_path.replace(os.sep, "/"))
+
+    def is_complete(self, job):
+        record = self.records.get(self.relative_path(job))
+        return (record is not None
+                and record["line"] == job["line"]
+                and record["hash"] == payload_hash(job["data"])
+                and not record.get("flags")
+                and is_valid_wav(job["output_path"]))
+
+    def record(self, job, size, **extra):
+        entry = {
+            "line": job["line"],
+            "path": self.relative_path(job),
+            "hash": payload_hash(job["data"]),
+            "bytes": size,
+            "time": round(time.time(), 3),
+        }
+        entry.update(extra)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self.needs_newline:
+                    f.write("\n")  # 与崩溃时残留的半行隔开
+                    self.needs_newline = False
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[entry["path"]] = entry
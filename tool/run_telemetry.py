@@ -0,0 +1,190 @@
+"""
+逐行运行日志：每条台词一行 JSON，结束时追加按预设、按后端汇总的分位数
+
+用法（查看已有日志的汇总）：
+    python tool/run_telemetry.py output/.telemetry/anon_test-20250101-120000.jsonl
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import threading
+
+import numpy as np
+
+from audio_quality import count_chars
+
+
+TELEMETRY_DIR = ".telemetry"
+PERCENTILES = (50, 90, 99)
+# 参与分位数统计的指标
+METRICS = ("latency", "rtf", "ttfb", "queue_wait", "pacing_wait", "post_time", "audio_duration")
+
+
+def wav_duration(source):
+    """由 WAV 头得到时长（秒），source 为字节或文件路径；无法解析时返回 None"""
+    try:
+        with wave.open(io.BytesIO(source) if isinstance(source, bytes) else source, "rb") as reader:
+            return reader.getnframes() / reader.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def preset_of(data):
+    """台词所用的预设名；旧 JSONL 没有 preset 字段时按角色归类"""
+    return data.get("preset") or data.get("character") or "default"
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def describe(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    array = np.asarray(values, dtype=float)
+    result = {"count": len(values)}
+    for p, value in zip(PERCENTILES, np.percentile(array, PERCENTILES)):
+        result[f"p{p}"] = round(float(value), 3)
+    result["max"] = round(float(array.max()), 3)
+    return result
+
+
+def summarize(events):
+    """按预设与后端分组统计；缓存命中的行只计数，不参与延迟统计"""
+    def group_by(key):
+        groups = {}
+        for event in events:
+            groups.setdefault(event.get(key) or "-", []).append(event)
+        result = {}
+        for name, items in sorted(groups.items()):
+            synthesized = [e for e in items if e["ok"] and not e.get("cached")]
+            entry = {
+                "lines": len(items),
+                "failed": sum(1 for e in items if not e["ok"]),
+                "cached": sum(1 for e in items if e.get("cached")),
+                "flagged": sum(1 for e in items if e.get("flags")),
+                "retries": sum(e.get("retries", 0) for e in items),
+                "timeouts": sum(e.get("timeouts", 0) for e in items),
+                "errors": sum(e.get("errors", 0) for e in items),
+                "switches": sum(1 for e in items if e.get("switch")),
+                "switch_seconds": round(sum(e.get("switch") or 0 for e in items), 3),
+                "audio_seconds": round(sum(e.get("audio_duration") or 0 for e in synthesized), 3),
+                "bytes": sum(e.get("bytes") or 0 for e in items),
+            }
+            for metric in METRICS:
+                entry[metric] = describe([e.get(metric) for e in synthesized])
+            result[name] = entry
+        return result
+
+    return {"lines": len(events), "by_preset": group_by("preset"), "by_backend": group_by("backend")}
+
+
+def format_summary(summary):
+    """汇总的简要文字版（每个预设、每个后端一行）"""
+    lines = []
+    for title, key in (("预设", "by_preset"), ("后端", "by_backend")):
+        for name, entry in summary[key].items():
+            latency, rtf = entry["latency"], entry["rtf"]
+            text = f"{title} {name}：{entry['lines']} 条"
+            if latency:
+                text += f"，延迟 p50 {latency['p50']:.2f}s / p90 {latency['p90']:.2f}s"
+            if rtf:
+                text += f"，RTF p50 {rtf['p50']:.2f} / p90 {rtf['p90']:.2f}"
+            if entry["switches"]:
+                text += f"，切换权重 {entry['switches']} 次共 {entry['switch_seconds']:.1f}s"
+            if entry["timeouts"]:
+                text += f"，超时重试 {entry['timeouts']} 次"
+            if entry["errors"]:
+                text += f"，出错重试 {entry['errors']} 次"
+            if entry["failed"]:
+                text += f"，失败 {entry['failed']} 条"
+            lines.append(text)
+    return lines
+
+
+class RunTelemetry:
+    """
+    一次生成的运行日志（<output_root>/.telemetry/<场景名>-<时间>.jsonl）
+
+    每行字段：line、path、preset、chars（字数）、backend、ok、queue_wait、switch、pacing_wait、latency、ttfb、
+    post_time、audio_duration、rtf（合成用时 / 音频时长）、bytes、retries，以及 elapsed（该条总用时）、cached、flags、
+    timeouts、errors（出错重试次数）、error 等附加项。
+    latency 只算请求本身；发出请求前的节流、等待恢复用时记为 pacing_wait，收到后的质量检查与写文件用时记为 post_time。
+    queue_wait、switch、backend 由调度器写入任务 dict，pacing_wait、post_time 由处理任务的一方写入。
+    """
+
+    def __init__(self, output_root, base_name):
+        self.output_root = output_root
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(output_root, TELEMETRY_DIR, f"{base_name}-{stamp}.jsonl")
+        self.events = []
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def record(self, job, ok, latency=None, ttfb=None, size=0, audio=None, **extra):
+        """latency 为请求本身的用时；audio 为输出文件路径或 WAV 字节，用于计算音频时长与 RTF"""
+        duration = wav_duration(audio) if ok and audio is not None else None
+        data = job["data"]
+        event = {
+            "event": "line",
+            "line": job["line"],
+            "path": os.path.relpath(job["output_path"], self.output_root).replace(os.sep, "/"),
+            "preset": preset_of(data),
+            "chars": count_chars(data.get("text", "")),
+            "backend": job.get("backend"),
+            "ok": ok,
+            "queue_wait": _round(job.get("queue_wait")),
+            "switch": _round(job.get("switch_time", 0.0)),
+            "pacing_wait": _round(job.get("pacing_wait")),
+            "latency": _round(latency),
+            "ttfb": _round(ttfb),
+            "post_time": _round(job.get("post_time")),
+            "audio_duration": _round(duration),
+            "rtf": _round(latency / duration) if latency is not None and duration else None,
+            "bytes": size,
+            "retries": job.get("attempt", 0),
+        }
+        extra.setdefault("timeouts", job.get("timeouts"))
+        extra.setdefault("errors", job.get("errors"))
+        event.update({key: value for key, value in extra.items() if value})
+        with self.lock:
+            self.events.append(event)
+            self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self.file.flush()
+        return event
+
+    def close(self):
+        """写入汇总并关闭日志，返回汇总 dict"""
+        with self.lock:
+            summary = summarize(self.events)
+            summary["elapsed"] = round(time.monotonic() - self.started, 3)
+            self.file.write(json.dumps(dict(summary, event="summary"), ensure_ascii=False) + "\n")
+            self.file.close()
+        return summary
+
+
+def load_events(path):
+    with open(path, "r", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return [event for event in events if event.get("event") == "line"]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print(__doc__.strip())
+        return 2
+    summary = summarize(load_events(argv[0]))
+    for line in format_summary(summary):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
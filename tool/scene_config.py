@@ -0,0 +1,58 @@
+from compact_jobs import write_jobs
+
+
+def resolve_preset(character, line, preset_data, emotions_data):
+    """
+    为场景中的一行选择预设，返回 (text, preset_name, preset)
+
+    带情感标签的行按 emotions.json 的映射选择预设，找不到时使用角色默认预设；
+    旧格式（纯文本）直接使用角色默认预设。
+    """
+    if isinstance(line, dict) and "text" in line and "emotion" in line:
+        text = line["text"]
+        emotion = line["emotion"]
+
+        # 根据emotions.json中的映射关系选择预设
+        emotion_preset_key = emotions_data.get(character, {}).get(emotion)
+        if emotion_preset_key:
+            return text, emotion_preset_key, preset_data.get(emotion_preset_key, {})
+        # 如果emotions.json中没有映射，尝试使用角色默认预设
+        return text, character, preset_data.get(character, {})
+
+    # 处理旧格式（纯文本）
+    return str(line), character, preset_data.get(character, {})
+
+
+def scene_configs(scene_data, preset_data, emotions_data, defaults):
+    """
+    把场景 JSON（{角色: [台词, ...]}）逐行转换为 TTS 请求配置
+
+    Args:
+        defaults: 预设中缺少的字段使用的界面默认值，键为 text_lang、prompt_lang、ref_audio_path、
+                  prompt_text、gpt_weight、sovits_weight、sample_steps
+    """
+    for character, lines in scene_data.items():
+        for line in lines:
+            text, preset_name, preset = resolve_preset(character, line, preset_data, emotions_data)
+            yield {
+                "character": character,  # 统一使用角色名
+                "preset": preset_name if preset else "default",  # 所用预设，仅用于运行日志统计
+                "text": text,
+                "text_lang": preset.get("text_lang", defaults["text_lang"]),
+                "ref_audio_path": preset.get("ref_audio_path", defaults["ref_audio_path"]),
+                "prompt_text": preset.get("prompt_text", defaults["prompt_text"]),
+                "prompt_lang": preset.get("prompt_lang", defaults["prompt_lang"]),
+                "prompt": preset.get("prompt", ""),  # 翻译提示字段
+                "text_split_method": "cut5",
+                "batch_size": 1,
+                "media_type": "wav",
+                "streaming_mode": False,
+                "sample_steps": preset.get("sample_steps", defaults["sample_steps"]),
+                "gpt_weight": preset.get("gpt_weight", defaults["gpt_weight"]),
+                "sovits_weight": preset.get("sovits_weight", defaults["sovits_weight"]),
+            }
+
+
+def write_scene_jsonl(scene_data, preset_data, emotions_data, defaults, output_path, compact=False):
+    """写出推理用 JSONL（compact 为 True 时写紧凑格式 .cjsonl），返回条数"""
+    return write_jobs(scene_configs(scene_data, preset_data, emotions_data, defaults), output_path, compact)
@@ -0,0 +1,57 @@
+import threading
+
+
+FLUSH_INTERVAL = 0.1  # 秒；界面每个周期最多处理一次各类通知
+
+
+class SignalCoalescer:
+    """
+    把工作线程的逐条通知合并后定时发出
+
+    每个通道要么只保留最新值（状态文字、进度），要么累积为列表（新生成的文件）。
+    由独立的定时线程发出，不依赖工作线程的事件循环；close() 会立即发出剩余内容。
+    发出顺序与 add_channel 的顺序一致。
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.channels = {}  # 名称 → (emit, 是否累积)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.emit_lock = threading.Lock()  # 定时线程与 close() 的发出不交错
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add_channel(self, name, emit, accumulate=False):
+        self.channels[name] = (emit, accumulate)
+
+    def push(self, name, value):
+        with self.lock:
+            if self.channels[name][1]:
+                self.pending.setdefault(name, []).append(value)
+            else:
+                self.pending[name] = value
+
+    def flush(self):
+        with self.emit_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for name, (emit, _) in self.channels.items():
+                if name in pending:
+                    emit(pending[name])
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
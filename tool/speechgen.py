@@ -6,17 +6,29 @@ from PyQt5.QtWidgets import (
     QLabel, QWidget, QTextEdit, QComboBox,
     QHBoxLayout, QLineEdit, QFileDialog, QInputDialog,
     QDialog, QTreeWidget, QTreeWidgetItem, QMessageBox,
-    QSplitter, QScrollArea, QFrame, QGridLayout
+    QSplitter, QScrollArea, QFrame, QGridLayout, QCheckBox
 )
 from PyQt5.QtGui import QFont, QPalette, QColor
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, pyqtSignal
 import subprocess
+import threading
+import time
 import requests
 from requests.exceptions import RequestException
-import socket
 
 import pygame
 
+# 保证从项目根目录启动时也能导入同目录模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from scene_config import write_scene_jsonl
+from compact_jobs import write_jobs, COMPACT_SUFFIX
+from tts_client import get_client
+from weights_state import get_weights_state
+from backend_supervisor import BackendSupervisor, load_config
+
 pygame.mixer.init()
 
 
@@ -215,14 +227,10 @@ class EmotionsManagerDialog(QDialog):
             QMessageBox.critical(self, "错误", f"保存情感配置失败: {e}")
 
 
-def is_port_in_use(host: str, port: int) -> bool:
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.settimeout(1)
-        result = s.connect_ex((host, port))
-        return result == 0  # 0 表示连接成功，说明端口已被占用
-
-
 class SpeechGenApp(QMainWindow):
+    weights_message = pyqtSignal(str)  # 后台切换权重的结果
+    api_message = pyqtSignal(str)  # API 实例的启动、就绪与重启
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("语音生成配置文件创建工具")
@@ -239,12 +247,20 @@ class SpeechGenApp(QMainWindow):
             "vocal": os.path.join(self.base_dir, "vocal"),
             "reference": os.path.join(self.base_dir, "reference")
         }
-        self.api_bat_path = os.path.normpath(os.path.join(self.base_dir, "api.bat"))
+
+        # 下拉框连续切换时只加载最后选中的权重
+        self.pending_weights = {}
+        self.weights_timer = QTimer(self)
+        self.weights_timer.setSingleShot(True)
+        self.weights_timer.timeout.connect(self.flush_weights_request)
 
         self.init_ui()
-        QTimer.singleShot(1000, self.start_api_service)
+        self.weights_message.connect(self.output_text.append)
+        self.api_message.connect(self.output_text.append)
 
         self.api_base = "http://127.0.0.1:9865"
+        self.supervisor = None
+        self.start_api_service()
 
     def init_cyberpunk_style(self):
         palette = self.palette()
@@ -494,7 +510,11 @@ class SpeechGenApp(QMainWindow):
             "background-color: #66d9ef; color: #272822; border-radius: 5px; padding: 10px; font-size: 16px;")
         self.btn_choose_scene_json.clicked.connect(self.choose_scene_json)
 
+        # 紧凑格式把预设字段集中存放，每行只保留台词，文件小、读取快
+        self.chk_compact = QCheckBox("紧凑格式（.cjsonl）")
+
         hbox.addWidget(self.btn_choose_scene_json)
+        hbox.addWidget(self.chk_compact)
         self.layout.addLayout(hbox)
 
     # 选择场景
@@ -549,68 +569,19 @@ class SpeechGenApp(QMainWindow):
             os.makedirs(output_dir, exist_ok=True)
 
             base_name = os.path.splitext(os.path.basename(json_file))[0]
-            output_path = os.path.join(output_dir, f"{base_name}.jsonl")
-
-            with open(output_path, "w", encoding="utf-8") as f_out:
-                count = 0
-                for character, lines in scene_data.items():
-                    for line in lines:
-                        # 处理情感标签
-                        if isinstance(line, dict) and "text" in line and "emotion" in line:
-                            text = line["text"]
-                            emotion = line["emotion"]
-                            
-                            # 根据emotions.json中的映射关系选择预设
-                            emotion_preset_key = None
-                            if character in emotions_data and emotion in emotions_data[character]:
-                                emotion_preset_key = emotions_data[character][emotion]
-                            
-                            # 使用映射的预设键查找预设
-                            if emotion_preset_key:
-                                preset = preset_data.get(emotion_preset_key, {})
-                            else:
-                                # 如果emotions.json中没有映射，尝试使用角色默认预设
-                                preset = preset_data.get(character, {})
-                            
-                            # 如果还是没找到，使用界面默认设置
-                            if not preset:
-                                preset = {}
-                        else:
-                            # 处理旧格式（纯文本）
-                            text = str(line)
-                            emotion = "idle"  # 默认情感
-                            
-                            # 使用角色默认预设
-                            preset = preset_data.get(character, {})
-
-                        # 获取配置参数
-                        text_lang = preset.get("text_lang", default_text_lang)
-                        prompt_lang = preset.get("prompt_lang", default_prompt_lang)
-                        ref_audio = preset.get("ref_audio_path", default_ref_audio)
-                        prompt_text = preset.get("prompt_text", default_prompt_text)
-                        translate_prompt = preset.get("prompt", "")  # 获取翻译提示字段
-                        gpt_weight = preset.get("gpt_weight", default_gpt_weight)
-                        sovits_weight = preset.get("sovits_weight", default_sovits_weight)
-                        sample_steps = preset.get("sample_steps", default_sample_steps)
-
-                        config = {
-                            "character": character,  # 统一使用角色名
-                            "text": text,
-                            "text_lang": text_lang,
-                            "ref_audio_path": ref_audio,
-                            "prompt_text": prompt_text,
-                            "prompt_lang": prompt_lang,
-                            "prompt": translate_prompt,  # 新增翻译提示字段
-                            "text_split_method": "cut5",
-                            "batch_size": 1,
-                            "media_type": "wav",
-                            "streaming_mode": False,
-                            "sample_steps": sample_steps,
-                            "gpt_weight": gpt_weight,
-                            "sovits_weight": sovits_weight
-                        }
-                        f_out.write(json.dumps(config, ensure_ascii=False) + "\n")
-                        count += 1
+            compact = self.chk_compact.isChecked()
+            output_path = os.path.join(output_dir, base_name + (COMPACT_SUFFIX if compact else ".jsonl"))
+
+            defaults = {
+                "text_lang": default_text_lang,
+                "prompt_lang": default_prompt_lang,
+                "ref_audio_path": default_ref_audio,
+                "prompt_text": default_prompt_text,
+                "gpt_weight": default_gpt_weight,
+                "sovits_weight": default_sovits_weight,
+                "sample_steps": default_sample_steps,
+            }
+            count = write_scene_jsonl(scene_data, preset_data, emotions_data, defaults, output_path, compact)
 
             self.output_text.setText(
                 f"✅ 场景JSON转换完成！\n▸ 输出路径：{output_path}\n▸ 总条数：{count}\n▸ ")
@@ -862,19 +833,30 @@ class SpeechGenApp(QMainWindow):
         self.send_weights_request(weight_type, selected_path)
 
     def send_weights_request(self, weight_type, rel_path):
-        endpoint = "/set_gpt_weights" if weight_type == "gpt" else "/set_sovits_weights"
-        url = f"{self.api_base}{endpoint}?weights_path={rel_path}"
-
-        # 取消设置权重测试
-        # try:
-        #     response = requests.get(url, timeout=10)
-        #     if response.status_code == 200:
-        #         result = response.text
-        #         self.output_text.append(f"✅ {weight_type.upper()}权重设置成功\n▸ 路径：{rel_path}\n▸ 返回信息：{result}")
-        #     else:
-        #         self.output_text.append(f"❌ 请求失败 HTTP {response.status_code}\n▸ URL：{url}")
-        # except RequestException as e:
-        #     self.output_text.append(f"❌ 网络请求失败\n▸ 错误类型：{type(e).__name__}\n▸ 详细信息：{str(e)}")
+        # 稍等片刻再发送，期间的多次选择合并为一次
+        self.pending_weights[weight_type] = rel_path
+        self.weights_timer.start(800)
+
+    def flush_weights_request(self):
+        weights = (self.pending_weights.pop("gpt", None), self.pending_weights.pop("sovits", None))
+        # 加载模型需要数秒，放到后台线程，界面不卡顿
+        threading.Thread(target=self.switch_weights_in_background, args=(weights,), daemon=True).start()
+
+    def switch_weights_in_background(self, weights):
+        # 本程序已加载过的不再重复发送（服务端重启、连接失败或长时间未通信时记录会清空）
+        state = get_weights_state(self.api_base)
+        try:
+            switched = state.switch(get_client(self.api_base), weights)
+        except RequestException as e:
+            self.weights_message.emit(f"❌ 权重设置失败\n▸ 错误类型：{type(e).__name__}\n▸ 详细信息：{str(e)}")
+            return
+        for kind, path in zip(("gpt", "sovits"), weights):
+            if not path:
+                continue
+            if kind in switched:
+                self.weights_message.emit(f"✅ {kind.upper()}权重设置成功\n▸ 路径：{path}")
+            else:
+                self.weights_message.emit(f"ℹ️ {kind.upper()}权重已加载，跳过\n▸ 路径：{path}")
 
     def generate_config(self):
         if not hasattr(self, 'selected_file') or not self.selected_file:
@@ -897,34 +879,33 @@ class SpeechGenApp(QMainWindow):
             with open(self.selected_file, "r", encoding="utf-8") as f:
                 lines = [line.strip() for line in f if line.strip()]
 
-            output_path = os.path.splitext(self.selected_file)[0] + ".jsonl"
-
-            with open(output_path, "w", encoding="utf-8") as f:
-                # speechgen.py 中的 generate_config 末尾：
-                gpt_weight = self.cmb_gpt_weights.currentText()
-                sovits_weight = self.cmb_sovits_weights.currentText()
-                sample_steps = int(self.cmb_sample_steps.currentText())
-
-                character = self.txt_character.text().strip() or "unknown"
-
-                for line in lines:
-                    config = {
-                        "character": character,
-                        "text": line,
-                        "text_lang": text_lang,
-                        "ref_audio_path": ref_audio,
-                        "prompt_text": prompt_text,
-                        "prompt_lang": prompt_lang,
-                        "prompt": translate_prompt,  # 新增翻译提示字段
-                        "text_split_method": "cut5",
-                        "batch_size": 1,
-                        "media_type": "wav",
-                        "streaming_mode": False,
-                        "sample_steps": sample_steps,
-                        "gpt_weight": gpt_weight,
-                        "sovits_weight": sovits_weight
-                    }
-                    f.write(json.dumps(config, ensure_ascii=False) + "\n")
+            compact = self.chk_compact.isChecked()
+            output_path = os.path.splitext(self.selected_file)[0] + (COMPACT_SUFFIX if compact else ".jsonl")
+
+            # speechgen.py 中的 generate_config 末尾：
+            gpt_weight = self.cmb_gpt_weights.currentText()
+            sovits_weight = self.cmb_sovits_weights.currentText()
+            sample_steps = int(self.cmb_sample_steps.currentText())
+
+            character = self.txt_character.text().strip() or "unknown"
+
+            configs = ({
+                "character": character,
+                "text": line,
+                "text_lang": text_lang,
+                "ref_audio_path": ref_audio,
+                "prompt_text": prompt_text,
+                "prompt_lang": prompt_lang,
+                "prompt": translate_prompt,  # 新增翻译提示字段
+                "text_split_method": "cut5",
+                "batch_size": 1,
+                "media_type": "wav",
+                "streaming_mode": False,
+                "sample_steps": sample_steps,
+                "gpt_weight": gpt_weight,
+                "sovits_weight": sovits_weight
+            } for line in lines)
+            write_jobs(configs, output_path, compact)
 
             self.output_text.setText(
                 f"✅ 配置文件生成成功！\n▸ 输出路径：{output_path}\n▸ 总行数：{len(lines)}\n▸ 文本语言：{text_lang}\n▸ 提示语言：{prompt_lang}\n▸ 参考音频：{ref_audio}")
@@ -933,25 +914,25 @@ class SpeechGenApp(QMainWindow):
             self.output_text.setText(f"❌ 生成失败：{str(e)}")
 
     def start_api_service(self):
+        """在后台启动并守护 API 实例（见 backend_supervisor），健康检查通过后才提示可以生成"""
         try:
-            if is_port_in_use("127.0.0.1", 9865):
-                self.output_text.append("ℹ️ 检测到端口 9865 已被占用，API 服务可能已在运行，跳过启动。")
-                return
-
-            if not os.path.exists(self.api_bat_path):
-                raise FileNotFoundError(f"API启动文件不存在：{self.api_bat_path}")
-
-            subprocess.Popen(
-                f'start cmd /k "{self.api_bat_path}"',
-                shell=True,
-                cwd=os.path.dirname(self.api_bat_path),
-                creationflags=subprocess.CREATE_NEW_CONSOLE
-            )
-
-            self.output_text.append("🚀 API服务已启动\n▸ 独立控制台窗口已打开\n▸ 服务端口：9865\n▸ 可随时关闭本程序")
-
-        except Exception as e:
-            self.output_text.append(f"❌ API启动失败：{str(e)}")
+            config = load_config()
+        except (OSError, ValueError) as e:
+            self.output_text.append(f"❌ 读取 supervisor.json 失败：{str(e)}")
+            return
+        self.supervisor = BackendSupervisor(config, log=self.api_message.emit)
+        threading.Thread(target=self.wait_api_ready, daemon=True).start()
+
+    def wait_api_ready(self):
+        started = time.monotonic()
+        self.supervisor.start()
+        backends = self.supervisor.wait_ready()
+        if not backends:
+            self.api_message.emit("❌ API 服务未能就绪\n▸ 请查看控制台窗口或 logs 目录中的输出")
+            return
+        self.api_message.emit(f"🚀 API 服务已就绪（{time.monotonic() - started:.0f}s）\n"
+                              f"▸ 地址：{', '.join(backend.base_url for backend in backends)}\n"
+                              f"▸ 进程退出时自动重启；关闭本程序后服务继续运行，但不再自动重启")
 
     def run_gen_vocal(self):
         gen_vocal_path = os.path.normpath(os.path.join(os.path.dirname(__file__), "gen_vocal.py"))
@@ -0,0 +1,130 @@
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from vocal_jobs import payload_hash
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(PROJECT_ROOT, "cache", "tts")
+DEFAULT_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# 这些字段是相对 GPT-SoVITS 目录的文件路径，内容变化时缓存需要失效
+FINGERPRINT_FIELDS = ("gpt_weight", "sovits_weight", "ref_audio_path")
+
+
+def default_sovits_dir():
+    return os.path.join(PROJECT_ROOT, os.getenv("SOVITS_DIR", "GPT-SoVITS-v4-20250422fix"))
+
+
+class SynthCache:
+    """
+    以请求内容为键的本地 WAV 缓存（LRU，按总大小淘汰）
+
+    键 = 规范化后的请求参数 + 权重文件与参考音频的指纹（大小与修改时间），
+    因此重新训练权重或替换参考音频后不会命中旧结果。
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, sovits_dir=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.sovits_dir = sovits_dir or default_sovits_dir()
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> 字节数，按最近使用排序
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+
+    def _scan(self):
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.is_file() and entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def fingerprint(self, rel_path):
+        if not rel_path:
+            return ""
+        path = rel_path if os.path.isabs(rel_path) else os.path.join(self.sovits_dir, rel_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return rel_path  # 本机找不到文件时只按路径区分
+        return f"{rel_path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def key_for(self, data):
+        digest = hashlib.sha256()
+        digest.update(payload_hash(data).encode("utf-8"))
+        for field in FINGERPRINT_FIELDS:
+            digest.update(b"\0" + self.fingerprint(data.get(field)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.wav")
+
+    def materialize(self, key, output_path):
+        """命中时把缓存复制到输出路径并返回 True（复制而非硬链接，避免之后覆盖输出时污染缓存）"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return False
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        cached_path = self.path_for(key)
+        tmp_path = output_path + ".tmp"
+        try:
+            shutil.copyfile(cached_path, tmp_path)
+            os.replace(tmp_path, output_path)
+            os.utime(cached_path)
+        except OSError:
+            # 缓存文件被外部删除，当作未命中
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return False
+        return True
+
+    def put(self, key, content):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self._add_entry(key, len(content))
+
+    def put_file(self, key, source_path):
+        """把已写好的输出文件存入缓存（流式写入时不必再读进内存）"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._add_entry(key, os.path.getsize(path))
+
+    def _add_entry(self, key, size):
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = size
+            self.total_bytes += size
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self.path_for(old_key))
+            except OSError:
+                pass
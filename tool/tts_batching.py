@@ -0,0 +1,120 @@
+import io
+import json
+import wave
+
+import numpy as np
+
+from vocal_jobs import canonical_payload
+
+
+# GPT-SoVITS 会把短于 5 个字的分段与相邻分段合并，这样的行无法在返回的音频里找到边界
+MIN_BATCH_CHARS = 5
+MAX_BATCH_CHARS = 15
+MAX_BATCH_SIZE = 8
+# 服务端在每个分段后补的静音长度（秒），拆分时据此找边界
+FRAGMENT_INTERVAL = 0.4
+
+
+def batch_signature(data):
+    """除文本外完全相同的请求才能合并（同一预设、同一权重与参数）"""
+    payload = canonical_payload(data)
+    payload.pop("text", None)
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False)
+
+
+def is_batchable(data, max_chars=MAX_BATCH_CHARS):
+    text = data.get("text", "").strip()
+    return MIN_BATCH_CHARS <= len(text) <= max_chars and "\n" not in text
+
+
+def bucket_jobs(jobs, max_chars=MAX_BATCH_CHARS, max_batch=MAX_BATCH_SIZE):
+    """
+    把共享预设的短句按长度分桶合并成批量任务
+
+    批量任务放在其第一条成员原来的位置，因此不会打乱按权重分组后的顺序；
+    凑不成批的短句和长句保持为单条任务。
+    """
+    buckets = {}
+    slots = []  # 单条任务或待定的桶（list）
+    for job in jobs:
+        data = job["data"]
+        if not is_batchable(data, max_chars):
+            slots.append(job)
+            continue
+        length_bucket = len(data["text"].strip()) // 5
+        key = (batch_signature(data), length_bucket)
+        bucket = buckets.get(key)
+        if bucket is None or len(bucket) >= max_batch:
+            bucket = buckets[key] = []
+            slots.append(bucket)
+        bucket.append(job)
+
+    result = []
+    for slot in slots:
+        if isinstance(slot, dict):
+            result.append(slot)
+        elif len(slot) == 1:
+            result.append(slot[0])
+        else:
+            result.append(make_batch_job(slot))
+    return result
+
+
+def make_batch_job(members):
+    data = dict(members[0]["data"])
+    data["text"] = "\n".join(member["data"]["text"].strip() for member in members)
+    data["text_split_method"] = "cut0"  # 只按换行切分，每行恰好一个分段
+    data["batch_size"] = len(members)
+    data["fragment_interval"] = FRAGMENT_INTERVAL
+    return {
+        "line": members[0]["line"],
+        "data": data,
+        "weights": members[0]["weights"],
+        "batch": members,
+    }
+
+
+def split_batch_audio(content, count, gap_seconds=FRAGMENT_INTERVAL):
+    """
+    按分段间补入的静音把批量返回的音频拆成 count 段 WAV
+
+    只有恰好找到 count - 1 处足够长的静音时才拆分，否则返回 None，由调用方逐条重试。
+    """
+    with wave.open(io.BytesIO(content), "rb") as reader:
+        params = reader.getparams()
+        frames = reader.readframes(reader.getnframes())
+    if params.sampwidth != 2 or params.nchannels != 1:
+        return None
+
+    samples = np.frombuffer(frames, dtype="<i2")
+    silent = np.abs(samples.astype(np.int32)) <= 2
+    # 找出所有连续静音区间 [start, end)
+    edges = np.diff(np.concatenate(([0], silent.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    min_gap = int(params.framerate * gap_seconds * 0.8)
+    gaps = [(start, end) for start, end in zip(starts, ends)
+            if end - start >= min_gap and start > 0 and end < len(samples)]
+    if len(gaps) != count - 1:
+        return None
+
+    pieces = []
+    position = 0
+    for start, end in gaps + [(len(samples), len(samples))]:
+        pieces.append(samples[position:start])
+        position = end
+
+    result = []
+    for piece in pieces:
+        piece = np.trim_zeros(piece, "b")
+        if len(piece) == 0:
+            return None
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(params.framerate)
+            writer.writeframes(piece.astype("<i2").tobytes())
+        result.append(buffer.getvalue())
+    return result
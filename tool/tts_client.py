@@ -0,0 +1,146 @@
+import os
+import time
+import struct
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_API_BASE = "http://127.0.0.1:9865"
+
+# 默认超时（秒）：(连接超时, 读取超时)
+CONNECT_TIMEOUT = 5
+WEIGHTS_TIMEOUT = 10
+TTS_TIMEOUT = 600  # 我不信一条语音十分钟跑不出来
+DEFAULT_POOL_SIZE = 8
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class TTSClient:
+    """GPT-SoVITS API 客户端，复用带连接池的 keep-alive Session"""
+
+    def __init__(self, base_url=DEFAULT_API_BASE, pool_size=DEFAULT_POOL_SIZE, connect_timeout=CONNECT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.pool_size = 0
+        self.session = requests.Session()
+        self.session.headers["Connection"] = "keep-alive"
+        self.resize_pool(pool_size)
+
+    def __repr__(self):
+        return f"TTSClient({self.base_url})"
+
+    def resize_pool(self, pool_size):
+        """连接池只增不减，保证并发请求数不超过池大小时不会新建连接"""
+        if pool_size <= self.pool_size:
+            return
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _timeout(self, read_timeout):
+        return (self.connect_timeout, read_timeout)
+
+    def get(self, path, params=None, timeout=WEIGHTS_TIMEOUT):
+        return self.session.get(f"{self.base_url}{path}", params=params, timeout=self._timeout(timeout))
+
+    def set_gpt_weights(self, weights_path, timeout=WEIGHTS_TIMEOUT):
+        return self.get("/set_gpt_weights", {"weights_path": weights_path}, timeout)
+
+    def set_sovits_weights(self, weights_path, timeout=WEIGHTS_TIMEOUT):
+        return self.get("/set_sovits_weights", {"weights_path": weights_path}, timeout)
+
+    def tts(self, data, timeout=TTS_TIMEOUT):
+        return self.session.post(f"{self.base_url}/tts", json=data, timeout=self._timeout(timeout))
+
+    def tts_stream_to_file(self, data, output_path, timeout=TTS_TIMEOUT):
+        """
+        以流式模式请求并边收边写入磁盘，不在内存中保留整段音频
+
+        先写入 output_path + ".part"，结束后修正 WAV 头并改名。
+        timeout 为相邻两个数据块之间的最长等待时间。
+
+        Returns:
+            (response, ttfb, size)：非 200 时 ttfb 为 None、size 为 0，文件不会生成
+        """
+        payload = dict(data, streaming_mode=True)
+        start = time.monotonic()
+        ttfb = None
+        size = 0
+        part_path = output_path + ".part"
+        with self.session.post(f"{self.base_url}/tts", json=payload, stream=True,
+                               timeout=self._timeout(timeout)) as response:
+            if response.status_code != 200:
+                response.content  # 读完错误信息，连接才能放回连接池
+                return response, None, 0
+            try:
+                with open(part_path, "wb") as f:
+                    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                        if not chunk:
+                            continue
+                        if ttfb is None:
+                            ttfb = time.monotonic() - start
+                        f.write(chunk)
+                        size += len(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if payload.get("media_type", "wav") == "wav" and size:
+                    finalize_wav_header(part_path)
+                os.replace(part_path, output_path)
+            except BaseException:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+        return response, ttfb, size
+
+    def close(self):
+        self.session.close()
+
+
+def finalize_wav_header(path):
+    """
+    流式返回的 WAV 头里长度字段是占位值（写头时还不知道总长度），
+    在全部数据写完后按实际文件大小回填 RIFF 与 data 块长度
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return False
+        f.seek(4)
+        f.write(struct.pack("<I", min(file_size - 8, 0xFFFFFFFF)))
+        offset = 12
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+            if chunk_id == b"data":
+                f.seek(offset + 4)
+                f.write(struct.pack("<I", min(file_size - offset - 8, 0xFFFFFFFF)))
+                return True
+            offset += 8 + chunk_size + (chunk_size & 1)
+    return False
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url=DEFAULT_API_BASE, pool_size=None):
+    """按地址获取共享客户端，同一实例的所有调用方共用一个连接池"""
+    key = base_url.rstrip("/")
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = TTSClient(key, pool_size or DEFAULT_POOL_SIZE)
+        elif pool_size:
+            client.resize_pool(pool_size)
+        return client
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
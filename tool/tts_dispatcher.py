@@ -0,0 +1,527 @@
+import os
+import json
+import threading
+from collections import deque
+
+import time
+
+import requests
+
+from tts_client import DEFAULT_API_BASE, TTS_TIMEOUT, get_client
+from tts_pacing import AdaptivePacer, parse_retry_after
+from retry_policy import (BackendUnavailable, CircuitBreaker, HEALTH_PATH, PROBE_TIMEOUT, retryable_error,
+                          retryable_status)
+from weights_state import get_weights_state
+from vocal_jobs import order_by_weights
+
+# 多后端配置文件（可选），放在项目根目录
+BACKENDS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backends.json")
+
+
+class Backend:
+    """一个 GPT-SoVITS API 实例，以及固定在它上面的权重对"""
+
+    def __init__(self, base_url, weights=None, max_inflight=1):
+        self.base_url = base_url.rstrip("/")
+        self.pinned = [tuple(pair) for pair in (weights or [])]
+        self.fixed = list(self.pinned)  # backends.json 中指定的权重对，排程时只在这些实例间分配
+        self.max_inflight = max(1, int(max_inflight))
+        self.state = get_weights_state(self.base_url)  # 已加载的权重，与同一地址的其他调用方共用
+        self.client = get_client(self.base_url, self.max_inflight + 1)
+        self.pacer = AdaptivePacer(self.max_inflight)
+        self.breaker = CircuitBreaker()  # 连续失败（服务关闭、重启中）时暂停该实例的请求
+
+    def __repr__(self):
+        return f"Backend({self.base_url})"
+
+    @property
+    def loaded(self):
+        """当前已加载的 (gpt, sovits)，未知时为 None"""
+        return self.state.loaded
+
+    def probe(self):
+        """健康探测：服务能正常响应"""
+        try:
+            return self.client.get(HEALTH_PATH, timeout=PROBE_TIMEOUT).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def wait_until_healthy(self):
+        """断路器断开时阻塞，直到健康探测成功；超过 HEALTH_WAIT 仍未恢复时抛出 BackendUnavailable"""
+        try:
+            waited = self.breaker.wait(self.probe)
+        except BackendUnavailable as e:
+            raise BackendUnavailable(f"{self.base_url} {e}") from None
+        if waited:
+            self.state.invalidate()  # 期间服务端可能已重启，只剩默认权重
+            self.pacer.recovered()
+
+    def switch_weights(self, weights):
+        """只切换与当前不同的那一半权重"""
+        self.wait_until_healthy()
+        try:
+            switched = self.state.switch(self.client, weights)
+        except requests.RequestException as e:
+            if retryable_error(e):
+                self.breaker.record_failure()
+            raise
+        if switched:  # 权重已加载时没有发出请求，不能说明服务可用
+            self.breaker.record_success()
+
+    def tts(self, data, timeout=TTS_TIMEOUT):
+        """发送 TTS 请求，节奏由服务端的延迟与错误信号决定，而不是固定等待"""
+        return self._paced(data, lambda: self.client.tts(data, timeout))
+
+    def tts_stream_to_file(self, data, output_path, timeout=TTS_TIMEOUT):
+        """流式请求并直接写入 output_path，返回 (response, ttfb, size)"""
+        return self._paced(data, lambda: self.client.tts_stream_to_file(data, output_path, timeout))
+
+    def _paced(self, data, request):
+        self.wait_until_healthy()
+        self.pacer.acquire()
+        try:
+            start = time.monotonic()
+            try:
+                result = request()
+            except requests.ReadTimeout:
+                self.pacer.record_timeout()
+                raise
+            except requests.RequestException as e:
+                self.pacer.record_error()
+                if isinstance(e, requests.ConnectionError):
+                    self.state.invalidate()  # 服务端关闭或正在重启，恢复后需要重新加载权重
+                if retryable_error(e):
+                    self.breaker.record_failure()
+                raise
+            response = result[0] if isinstance(result, tuple) else result
+            response.latency = time.monotonic() - start  # 请求本身的用时，不含上面的节流等待
+            if retryable_status(response.status_code):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if response.status_code >= 500:
+                self.pacer.record_overload(parse_retry_after(response))
+            elif response.status_code == 200:
+                self.pacer.record_success(time.monotonic() - start, len(data.get("text", "")))
+                self.state.touch()
+            return result
+        finally:
+            self.pacer.release()
+
+
+def load_backends(path=BACKENDS_PATH):
+    """
+    读取 backends.json，不存在时退回单个本地实例
+
+    格式示例：
+    [
+      {"url": "http://127.0.0.1:9865", "max_inflight": 1,
+       "weights": [["GPT_weights_v2/a.ckpt", "SoVITS_weights_v2/a.pth"]]},
+      {"url": "http://127.0.0.1:9866", "max_inflight": 2, "weights": []}
+    ]
+    未固定在任何实例上的权重对会在运行时分配给固定权重最少的实例。
+    """
+    if not path or not os.path.exists(path):
+        return [Backend(DEFAULT_API_BASE)]
+
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    backends = [Backend(item["url"], item.get("weights"), item.get("max_inflight", 1)) for item in config]
+    return backends or [Backend(DEFAULT_API_BASE)]
+
+
+class _Lane:
+    """单个后端的任务队列"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.queue = deque()
+        self.assigned = 0
+        self.inflight = 0
+        self.switching = False
+        self.workers = 0  # 当前在该后端上取任务的线程数
+        self.down = None  # 超过 HEALTH_WAIT 仍未恢复时的 BackendUnavailable，本次运行不再使用
+
+
+class TTSDispatcher:
+    """
+    把任务分发到多个后端：每条任务只发往已固定其权重对的实例，
+    每个实例最多同时处理 max_inflight 条，切换权重前先等待该实例上的请求全部返回。
+
+    取出任务时在任务 dict 上记录 backend、queue_wait（排队秒数）与 switch_time（为它切换权重的秒数），
+    供运行日志使用。
+
+    run() 进行中可以用 submit(priority=True) 插入优先任务（如界面上的重新生成），
+    它们排在各后端队首，在当前请求返回后立即执行。
+
+    给出 cost(job)（预计用时，秒）时按 plan() 分配任务，否则逐条按 route() 分配并保持给定顺序。
+
+    断路器断开的实例不再分到新任务，已排队的任务移到其他正常的实例；没有正常的实例时等待恢复，
+    超过 HEALTH_WAIT 仍未恢复则放弃该实例，无处可去的任务交给 on_error。
+    """
+
+    def __init__(self, backends, cost=None, switch_cost=0.0):
+        self.backends = backends
+        self.lanes = [_Lane(backend) for backend in backends]
+        self.cost = cost
+        self.switch_cost = switch_cost  # 一次权重切换的预计用时（秒）
+        self.cond = threading.Condition()
+        self.pending = 0
+        self.handler = None
+        self.on_error = None
+        self.closed = False  # run() 结束后不再接受新任务
+        self.threads = []
+
+    def usable(self):
+        """
+        可以接收任务的实例：优先断路器闭合的，其次尚在等待恢复的（调用方持有 self.cond）
+
+        全部已放弃时返回空列表。
+        """
+        lanes = [lane for lane in self.lanes if not lane.down]
+        return [lane for lane in lanes if not lane.backend.breaker.is_open] or lanes
+
+    def route(self, job):
+        """为任务选择后端；未固定的权重对会被固定到当前最空闲的实例上"""
+        weights = job["weights"]
+        lanes = self.usable() or self.lanes
+        candidates = [lane for lane in lanes if weights in lane.backend.pinned]
+        if not candidates:
+            lane = min(lanes, key=lambda l: (len(l.backend.pinned), l.assigned))
+            lane.backend.pinned.append(weights)
+            candidates = [lane]
+        return min(candidates, key=lambda l: l.assigned)
+
+    def plan(self, jobs):
+        """
+        按预计用时分配任务，使最后完成的实例尽早完成，返回 [(lane, job), ...]
+
+        最长处理时间优先（LPT）：各组按总用时从大到小，整组交给预计完成最早的实例
+        （尚未加载该权重对的实例多算一次切换用时）；超过平均每个实例用时的大组才拆开，
+        从长到短逐条分给预计完成最早的实例。各实例的队列仍按权重分组，组内从长到短。
+        只分给 usable() 的实例。调用方持有 self.cond。
+        """
+        groups = {}
+        for job in jobs:
+            job["cost"] = self.cost(job)
+            groups.setdefault(job["weights"], []).append(job)
+
+        lanes = self.usable() or self.lanes
+        finish = {}  # 各实例的预计完成时间
+        present = {}  # 各实例已加载或已排队的权重对
+        for lane in lanes:
+            finish[lane] = sum(job.get("cost", 0.0) for job in lane.queue) / lane.backend.max_inflight
+            present[lane] = {lane.backend.loaded} | {job["weights"] for job in lane.queue}
+        assigned = {lane: [] for lane in lanes}
+        share = (sum(finish.values()) + sum(job["cost"] for job in jobs)) / len(lanes)
+
+        def place(lane, weights, members):
+            if weights not in present[lane]:
+                present[lane].add(weights)
+                finish[lane] += self.switch_cost
+                if weights not in lane.backend.pinned:
+                    lane.backend.pinned.append(weights)  # 之后插入的同组任务（见 route）也发往这里
+            finish[lane] += sum(job["cost"] for job in members) / lane.backend.max_inflight
+            assigned[lane].extend(members)
+
+        def earliest(candidates, weights):
+            return min(candidates, key=lambda l: finish[l] + (0.0 if weights in present[l] else self.switch_cost))
+
+        for weights, group in sorted(groups.items(), key=lambda item: -sum(job["cost"] for job in item[1])):
+            group.sort(key=lambda job: job["cost"], reverse=True)
+            candidates = [lane for lane in lanes if weights in lane.backend.fixed] or lanes
+            if sum(job["cost"] for job in group) <= share:
+                place(earliest(candidates, weights), weights, group)
+                continue
+            for job in group:
+                place(earliest(candidates, weights), weights, [job])
+
+        return [(lane, job) for lane in lanes
+                for job in order_by_weights(assigned[lane], lane.backend.loaded)]
+
+    def run(self, jobs, handler, on_error):
+        """
+        阻塞执行全部任务
+
+        Args:
+            jobs: vocal_jobs.build_jobs 生成的任务，按期望的执行顺序排列
+            handler: handler(backend, job)，在后端工作线程中执行实际请求
+            on_error: on_error(job, exc)，切换权重失败或 handler 抛出异常时调用
+        """
+        with self.cond:
+            self.handler = handler
+            self.on_error = on_error
+        self.submit(jobs)
+
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+            self.closed = True
+        for thread in self.threads:
+            thread.join()
+
+    def close(self):
+        """不再接受新任务；run() 结束时自动调用，运行提前结束时由调用方调用"""
+        with self.cond:
+            self.closed = True
+
+    def submit(self, jobs, priority=False):
+        """
+        追加任务；priority 时按给定顺序插到各后端队首
+
+        只在 run() 进行中接受；run() 尚未开始、已结束或已 close() 时返回 False，由调用方另行处理
+        （运行可能在开始前就结束，如没有可用的实例，此时提交的任务不会执行）。
+        """
+        with self.cond:
+            if self.closed or self.handler is None:
+                return False
+            self._enqueue(jobs, priority)
+            self.pending += len(jobs)
+            self._start_workers()
+            self.cond.notify_all()
+        return True
+
+    def _enqueue(self, jobs, priority=False):
+        """按 plan() 或 route() 把任务放入各实例队列（调用方持有 self.cond）"""
+        now = time.monotonic()
+        if self.cost is not None and not priority:
+            routed = self.plan(jobs)
+        else:
+            routed = [(self.route(job), job) for job in jobs]
+        for lane, job in (reversed(routed) if priority else routed):
+            job["enqueued"] = now
+            if priority:
+                lane.queue.appendleft(job)
+            else:
+                lane.queue.append(job)
+            lane.assigned += 1
+
+    def _start_workers(self):
+        """为有任务的后端补足工作线程（调用方持有 self.cond）"""
+        if self.handler is None:
+            return
+        for lane in self.lanes:
+            while lane.queue and lane.workers < lane.backend.max_inflight:
+                lane.workers += 1
+                thread = threading.Thread(target=self._lane_worker, args=(lane,), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def requeue(self, backend, job, delay=0.0):
+        """
+        在 handler 中把任务重新放回该后端队首（权重仍已加载，不会触发切换）
+
+        调用方所在的工作线程返回后会取到它，因此不会因其他线程已退出而丢失。
+        delay 秒内该后端暂停取任务（失败重试的退避），期间插入的优先任务不受影响。
+        """
+        with self.cond:
+            lane = next(lane for lane in self.lanes if lane.backend is backend)
+            job["enqueued"] = time.monotonic()
+            if delay > 0:
+                job["not_before"] = job["enqueued"] + delay
+            lane.queue.appendleft(job)
+            lane.assigned += 1
+            self.pending += 1
+            self.cond.notify_all()
+
+    def reroute(self, job):
+        """
+        把卡住的任务改派到其他实例（job["backend"] 以外）的队首，返回接手的后端
+
+        优先选已加载、其次已固定该权重对的实例（只在 usable() 中选）；只有一个实例时放回原队首。
+        """
+        with self.cond:
+            lanes = self.usable() or self.lanes
+            others = [lane for lane in lanes if lane.backend.base_url != job.get("backend")] or lanes
+            weights = job["weights"]
+            lane = min(others, key=lambda l: (l.backend.loaded != weights, weights not in l.backend.pinned,
+                                              len(l.queue)))
+            job["enqueued"] = time.monotonic()
+            lane.queue.appendleft(job)
+            lane.assigned += 1
+            self.pending += 1
+            self._start_workers()  # 接手的后端可能已没有工作线程
+            self.cond.notify_all()
+            return lane.backend
+
+    def add_backend(self, backend):
+        """
+        加入新实例（如运行中新启动的），返回分给它的任务数
+
+        从排队超过平均数的实例队尾分走任务，使各实例排队的预计用时（没有估计时为条数）大致相当；
+        各实例正在使用的权重对不分走。分走的权重对改为固定在新实例上（原实例仍有剩余任务时两边都固定）。
+        已有同一地址的实例（如启动时尚未就绪的）时视为它已恢复，照样分给它任务。
+        """
+        def weight(jobs):
+            return sum(job.get("cost", 1.0) for job in jobs)
+
+        with self.cond:
+            if self.closed:
+                return 0
+            lane = next((lane for lane in self.lanes if lane.backend.base_url == backend.base_url), None)
+            if lane is None:
+                lane = _Lane(backend)
+                self.lanes.append(lane)
+                self.backends = self.backends + [backend]  # 不修改调用方传入的列表
+            else:
+                lane.down = None
+                lane.backend.breaker.record_success()
+            backend = lane.backend
+
+            share = weight(job for other in self.lanes for job in other.queue) / len(self.lanes)
+            taken = weight(lane.queue)
+            count = 0
+            for donor in sorted(self.lanes, key=lambda l: weight(l.queue), reverse=True):
+                if donor is lane:
+                    continue
+                if taken >= share:
+                    break
+                loaded = donor.backend.loaded
+                left = weight(donor.queue)
+                moved = deque()
+                while taken < share and left > share and donor.queue[-1]["weights"] != loaded:
+                    job = donor.queue.pop()
+                    moved.appendleft(job)
+                    taken += job.get("cost", 1.0)
+                    left -= job.get("cost", 1.0)
+                remaining = {job["weights"] for job in donor.queue}
+                for weights in {job["weights"] for job in moved}:
+                    if weights not in backend.pinned:
+                        backend.pinned.append(weights)
+                    if weights not in remaining and weights in donor.backend.pinned:
+                        donor.backend.pinned.remove(weights)
+                lane.queue.extend(moved)
+                donor.assigned -= len(moved)
+                count += len(moved)
+            lane.assigned += count
+            self._start_workers()
+            self.cond.notify_all()
+            return count
+
+    def _move_queue(self, lane):
+        """把该实例排队的任务重新分给 usable() 中的实例（调用方持有 self.cond）"""
+        jobs = list(lane.queue)
+        lane.queue.clear()
+        lane.assigned -= len(jobs)
+        self._enqueue(jobs)
+        self._start_workers()
+        self.cond.notify_all()
+
+    def _wait_healthy(self, lane):
+        """
+        该实例断路器断开时调用，返回 False 表示工作线程应退出
+
+        有其他正常的实例时把队列移过去；否则等待恢复，超过 HEALTH_WAIT 仍未恢复则放弃该实例：排队的任务移到其他尚在等待的实例，
+        都已放弃时交给 on_error，run() 照常结束。
+        """
+        if not lane.down:
+            with self.cond:
+                if lane not in self.usable():  # 已有其他正常的实例
+                    lane.workers -= 1
+                    self._move_queue(lane)
+                    return False
+            try:
+                lane.backend.wait_until_healthy()
+                return True
+            except BackendUnavailable as e:
+                lane.down = e
+        with self.cond:
+            lane.workers -= 1
+            failed = []
+            if self.usable():
+                self._move_queue(lane)
+            else:
+                failed = list(lane.queue)
+                lane.queue.clear()
+                lane.assigned -= len(failed)
+        for job in failed:
+            try:
+                self.on_error(job, lane.down)
+            finally:
+                with self.cond:
+                    self.pending -= 1
+                    self.cond.notify_all()
+        return False
+
+    def _next_job(self, lane):
+        """
+        取出下一条任务；需要切换权重时等待该实例空闲。返回 (job, need_switch)
+
+        该实例断路器断开时，有其他正常的实例就把队列移过去；已放弃且无处可移时
+        返回 (None, None)，由 _wait_healthy 处理剩下的任务。
+        """
+        with self.cond:
+            while True:
+                if lane.queue and (lane.down or lane.backend.breaker.is_open):
+                    usable = self.usable()
+                    if usable and lane not in usable:
+                        self._move_queue(lane)
+                    elif lane.down:
+                        return None, None
+                if not lane.queue:
+                    lane.workers -= 1
+                    return None, False
+                if not lane.switching:
+                    job = lane.queue[0]
+                    wait = job.get("not_before", 0) - time.monotonic()
+                    if wait > 0:
+                        self.cond.wait(wait)
+                        continue
+                    job.pop("not_before", None)
+                    if job["weights"] == lane.backend.loaded:
+                        lane.queue.popleft()
+                        lane.inflight += 1
+                        return job, False
+                    if lane.inflight == 0:
+                        lane.queue.popleft()
+                        lane.switching = True
+                        return job, True
+                self.cond.wait()
+
+    def _lane_worker(self, lane):
+        backend = lane.backend
+        handler, on_error = self.handler, self.on_error
+        while True:
+            if (lane.down or backend.breaker.is_open) and not self._wait_healthy(lane):
+                return
+            job, need_switch = self._next_job(lane)
+            if need_switch is None:
+                continue
+            if job is None:
+                return
+            job["backend"] = backend.base_url
+            job["queue_wait"] = time.monotonic() - job.pop("enqueued", time.monotonic())
+            job["switch_time"] = 0.0
+
+            if need_switch:
+                switch_start = time.monotonic()
+                try:
+                    backend.switch_weights(job["weights"])
+                except Exception as e:
+                    with self.cond:
+                        lane.switching = False
+                        self.cond.notify_all()
+                    # on_error 可能把任务改派（reroute），完成后才计为处理完毕
+                    try:
+                        on_error(job, e)
+                    finally:
+                        with self.cond:
+                            self.pending -= 1
+                            self.cond.notify_all()
+                    continue
+                job["switch_time"] = time.monotonic() - switch_start
+                with self.cond:
+                    lane.switching = False
+                    lane.inflight += 1
+                    self.cond.notify_all()
+
+            try:
+                handler(backend, job)
+            except Exception as e:
+                on_error(job, e)
+            finally:
+                with self.cond:
+                    lane.inflight -= 1
+                    self.pending -= 1
+                    self.cond.notify_all()
@@ -0,0 +1,96 @@
+import threading
+import time
+
+
+class AdaptivePacer:
+    """
+    根据服务端信号自适应调整请求节奏（加性增、乘性减）
+
+    - 响应正常：逐步放开并发窗口，请求间隔衰减到 0，尽可能快地发送；
+    - 延迟明显高于基线：收缩并发窗口；
+    - 5xx / 503 / 连接错误：窗口减半并加大请求间隔（遵守 Retry-After）；
+    - 读取超时：实例仍在处理被放弃的请求，只收缩窗口，不加大间隔（后续超时的任务会被改派）。
+    """
+
+    def __init__(self, max_window=1, min_delay=0.0, max_delay=30.0, latency_factor=2.0):
+        self.max_window = max(1, int(max_window))
+        self.window = self.max_window
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latency_factor = latency_factor
+        self.delay = min_delay
+        self.baseline = None  # 每字延迟基线（秒/字）
+        self.inflight = 0
+        self.last_send = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """请求发出前调用：等待并发窗口空出，并保持当前请求间隔"""
+        with self.cond:
+            while self.inflight >= self.window:
+                self.cond.wait()
+            self.inflight += 1
+            wait = self.last_send + self.delay - time.monotonic()
+            self.last_send = max(time.monotonic(), self.last_send + self.delay)
+        if wait > 0:
+            time.sleep(wait)
+
+    def release(self):
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify_all()
+
+    def record_success(self, latency, units=1):
+        """请求成功：units 为工作量（例如文本字数），用于把延迟归一化"""
+        per_unit = latency / max(1, units)
+        with self.cond:
+            if self.baseline is None:
+                self.baseline = per_unit
+            if per_unit > self.baseline * self.latency_factor:
+                # 后端开始积压，收缩窗口
+                self.window = max(1, self.window - 1)
+            else:
+                self.window = min(self.max_window, self.window + 1)
+                self.delay = max(self.min_delay, self.delay / 2 if self.delay > 0.01 else 0.0)
+            # 基线快降慢升，避免被偶发的慢请求带偏
+            if per_unit < self.baseline:
+                self.baseline = per_unit
+            else:
+                self.baseline += (per_unit - self.baseline) * 0.05
+            self.cond.notify_all()
+
+    def record_overload(self, retry_after=None):
+        """收到 5xx / 503：窗口减半并退避"""
+        with self.cond:
+            self.window = max(1, self.window // 2)
+            self.delay = min(self.max_delay, max(self.delay * 2, 0.5, retry_after or 0))
+            self.cond.notify_all()
+
+    def record_timeout(self):
+        """读取超时：同时只发一条，等实例恢复"""
+        with self.cond:
+            self.window = 1
+            self.cond.notify_all()
+
+    def recovered(self):
+        """实例恢复（健康探测通过）：清除退避间隔，窗口从 1 开始逐步放开"""
+        with self.cond:
+            self.window = 1
+            self.delay = self.min_delay
+            self.cond.notify_all()
+
+    def record_error(self):
+        """连接错误：通常是服务正在重启或已过载"""
+        with self.cond:
+            self.window = 1
+            self.delay = min(self.max_delay, max(self.delay * 2, 1.0))
+            self.cond.notify_all()
+
+
+def parse_retry_after(response):
+    """解析 Retry-After 头（仅支持秒数）"""
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
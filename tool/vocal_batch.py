@@ -0,0 +1,472 @@
+"""
+无界面的 JSONL 批量合成（asyncio），适合在无显示器的 Linux 渲染机上跑通宵任务
+
+用法：
+    python tool/vocal_batch.py output/anon_test.jsonl output -c 4
+    python tool/vocal_batch.py scene.jsonl out --url http://127.0.0.1:9865 --resume --json
+    python tool/vocal_batch.py scene.jsonl out --postprocess --encode opus
+    python tool/vocal_batch.py output/ch1_*.jsonl output    # 多个文件合并生成，每组权重只加载一次
+    python tool/vocal_batch.py scene.jsonl out --launch     # 自行启动 API，就绪后开始，结束时停止
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit, urlencode
+
+# 保证从项目根目录启动时也能导入同目录模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from vocal_jobs import build_merged_jobs, merged_run_name, order_by_weights, base_name_from_path
+from compact_jobs import open_job_source
+from run_manifest import RunManifest, atomic_write_bytes
+from tts_client import DEFAULT_API_BASE, CONNECT_TIMEOUT, WEIGHTS_TIMEOUT, TTS_TIMEOUT
+from audio_post import AudioPostProcessor, ENCODERS
+from audio_quality import inspect, load_thresholds
+from run_telemetry import RunTelemetry, format_summary
+from latency_model import LatencyModel
+from weights_state import get_weights_state
+from backend_supervisor import BackendSupervisor, load_config
+from retry_policy import (BackendUnavailable, CircuitBreaker, MAX_RETRIES, PROBE_MAX_DELAY, PROBE_TIMEOUT, HEALTH_PATH,
+                          HEALTH_WAIT, backoff_delay, retryable_status)
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status} {body[:200].decode('utf-8', 'replace')}")
+        self.status = status
+
+
+class AsyncHTTPClient:
+    """基于 asyncio 流的最小 HTTP/1.1 客户端，复用 keep-alive 连接"""
+
+    def __init__(self, base_url=DEFAULT_API_BASE, pool_size=8, connect_timeout=CONNECT_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.idle = []  # 空闲连接 (reader, writer)
+
+    async def _open(self):
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.connect_timeout)
+
+    async def request(self, method, path, params=None, body=None, timeout=TTS_TIMEOUT):
+        """返回 (status, headers, body)；复用的空闲连接已被服务端关闭时自动换新连接重试一次"""
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Connection: keep-alive\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n").encode("latin-1")
+
+        while True:
+            reused = bool(self.idle)
+            reader, writer = self.idle.pop() if reused else await self._open()
+            try:
+                writer.write(head + payload)
+                await writer.drain()
+                status, headers, data = await asyncio.wait_for(self._read_response(reader), timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                if reused:
+                    continue
+                raise ConnectionError(str(e)) from e
+            except BaseException:
+                writer.close()
+                raise
+            break
+
+        if headers.get("connection", "").lower() == "close" or len(self.idle) >= self.pool_size:
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status, headers, data
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("连接已关闭")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read()
+            headers["connection"] = "close"
+        return status, headers, data
+
+    async def get(self, path, params=None, timeout=WEIGHTS_TIMEOUT):
+        status, _, data = await self.request("GET", path, params=params, timeout=timeout)
+        if status != 200:
+            raise HTTPStatusError(status, data)
+        return data
+
+    async def tts(self, data, timeout=TTS_TIMEOUT):
+        status, _, body = await self.request("POST", "/tts", body=data, timeout=timeout)
+        if status != 200:
+            raise HTTPStatusError(status, body)
+        return body
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+class BatchEngine:
+    """
+    与 WorkerThread 相同的编号与命名规则，但不依赖 Qt：
+    按权重分组，每组切换一次权重，组内最多 concurrency 条请求并发。
+    """
+
+    def __init__(self, base_url=DEFAULT_API_BASE, concurrency=4, resume=False, emit=None, postprocess=None,
+                 quality=None, quality_retries=0):
+        self.base_url = base_url.rstrip("/")
+        self.client = AsyncHTTPClient(base_url, pool_size=concurrency)
+        self.telemetry = None
+        self.postprocess = postprocess  # 后处理选项，见 audio_post.process_file
+        self.post = None
+        self.quality = quality  # 质量检查阈值，为 None 时只检查大小
+        self.quality_retries = quality_retries
+        self.concurrency = max(1, concurrency)
+        self.resume = resume
+        self.emit = emit or (lambda event: None)
+        self.state = get_weights_state(self.base_url)  # 已加载的权重，同一地址的调用方共用
+        self.breaker = CircuitBreaker()  # 连续失败（服务关闭、重启中）时暂停全部请求
+        self.probe_lock = None  # asyncio.Lock，run() 中创建
+        self.unavailable = None  # 超过 HEALTH_WAIT 仍未恢复时的说明，之后的请求直接失败
+        self.retries = 0
+        self.done = 0
+        self.failed = 0
+        self.flagged = 0
+        self.total = 0
+
+    async def probe(self):
+        """健康探测：服务能正常响应"""
+        try:
+            await self.client.get(HEALTH_PATH, timeout=PROBE_TIMEOUT)
+        except (ConnectionError, OSError, asyncio.TimeoutError, HTTPStatusError):
+            return False
+        return True
+
+    async def wait_until_healthy(self):
+        """
+        断路器断开时暂停，由一个任务按退避间隔探测，服务恢复后全部继续
+
+        超过 HEALTH_WAIT 仍未恢复时抛出 BackendUnavailable，剩下的台词不再等待、直接记为失败。
+        """
+        deadline = time.monotonic() + HEALTH_WAIT
+        attempt = 0
+        while self.breaker.is_open:
+            async with self.probe_lock:
+                if self.unavailable is not None:
+                    raise BackendUnavailable(self.unavailable)
+                if not self.breaker.is_open:
+                    break
+                if not await self.probe():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.unavailable = f"{self.base_url} {HEALTH_WAIT:.0f}s 内未通过健康检查"
+                        self.emit({"event": "unavailable", "url": self.base_url, "wait": HEALTH_WAIT})
+                        raise BackendUnavailable(self.unavailable)
+                    await asyncio.sleep(min(remaining, backoff_delay(attempt, cap=PROBE_MAX_DELAY)))
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                self.state.invalidate()  # 期间服务端可能已重启，只剩默认权重
+                self.emit({"event": "resumed", "url": self.base_url})
+
+    async def call(self, request, job=None):
+        """
+        带重试地执行 request()：连接错误、超时和 5xx 按退避间隔重试，最多 MAX_RETRIES 次
+
+        断路器断开时先等待服务恢复；4xx 说明请求本身有问题，直接抛出。重试次数记在 job["errors"]。
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            await self.wait_until_healthy()
+            try:
+                result = await request()
+            except (OSError, asyncio.TimeoutError, HTTPStatusError) as e:
+                if isinstance(e, HTTPStatusError) and not retryable_status(e.status):
+                    self.breaker.record_success()  # 服务端能正常响应
+                    raise
+                if isinstance(e, ConnectionError):
+                    self.state.invalidate()  # 服务端关闭或正在重启，恢复后需要重新加载
+                if self.breaker.record_failure():
+                    self.emit({"event": "paused", "url": self.base_url, "error": f"{type(e).__name__}: {e}"})
+                if attempt == MAX_RETRIES:
+                    raise
+                self.retries += 1
+                delay = backoff_delay(attempt)
+                event = {"event": "retry", "attempt": attempt + 1, "delay": round(delay, 3),
+                         "error": f"{type(e).__name__}: {e}"}
+                if job is not None:
+                    job["errors"] = job.get("errors", 0) + 1
+                    event["line"] = job["line"] + 1
+                self.emit(event)
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def switch_weights(self, weights):
+        """只切换不同的那一半，失败时整体重试（服务端重启后两半都需要重新加载）"""
+        await self.call(lambda: self._switch_weights(weights))
+
+    async def request_tts(self, job):
+        """返回 (音频, 请求本身的用时)"""
+        # 服务端在组内重启过时，先重新加载本组的权重
+        await self._switch_weights(job["weights"])
+        start = time.monotonic()
+        audio = await self.client.tts(job["data"])
+        return audio, time.monotonic() - start
+
+    async def _switch_weights(self, weights):
+        for kind, path in self.state.needed(weights):
+            try:
+                await self.client.get(f"/set_{kind}_weights", {"weights_path": path})
+            except ConnectionError:
+                self.state.invalidate()  # 服务端关闭或正在重启，恢复后需要重新加载
+                raise
+            except Exception:
+                self.state.forget(kind)
+                raise
+            self.state.confirm(kind, path)
+
+    def finish(self, job, output_root, ok, elapsed=0.0, error=None, flags=None, size=0, audio=None, latency=None):
+        """elapsed 为该条的总用时，latency 为最后一次请求本身的用时"""
+        self.done += 1
+        if not ok:
+            self.failed += 1
+        self.telemetry.record(job, ok, latency, size=size, audio=audio, flags=flags, error=error,
+                              elapsed=round(elapsed, 3))
+        event = {"event": "done" if ok else "failed", "line": job["line"] + 1,
+                 "path": os.path.relpath(job["output_path"], output_root).replace(os.sep, "/"),
+                 "done": self.done, "total": self.total, "elapsed": round(elapsed, 3)}
+        if error:
+            event["error"] = error
+        if flags:
+            self.flagged += 1
+            event["flags"] = flags
+        self.emit(event)
+
+    async def synthesize(self, job, manifest, output_root, semaphore):
+        async with semaphore:
+            start = time.monotonic()
+            job["backend"] = self.base_url
+            job["queue_wait"] = start - job.pop("enqueued", start)
+            latency = None
+            try:
+                for attempt in range(self.quality_retries + 1):
+                    job["attempt"] = attempt
+                    requested = time.monotonic()
+                    audio, latency = await self.call(lambda: self.request_tts(job), job)
+                    received = time.monotonic()
+                    # 等待恢复、退避重试与重新加载权重的用时
+                    job["pacing_wait"] = received - requested - latency
+                    self.state.touch()
+                    if len(audio) < 500:
+                        raise ValueError("返回内容为空或无效")
+                    flags = []
+                    if self.quality is not None:
+                        _, flags = await asyncio.to_thread(inspect, audio, job["data"].get("text", ""), self.quality)
+                    if not flags:
+                        break
+                os.makedirs(job["output_dir"], exist_ok=True)
+                await asyncio.to_thread(atomic_write_bytes, job["output_path"], audio)
+                if flags:
+                    await asyncio.to_thread(manifest.record, job, len(audio), flags=flags)
+                else:
+                    await asyncio.to_thread(manifest.record, job, len(audio))
+                    if self.post is not None:
+                        self.post.submit(job["output_path"])
+                job["post_time"] = time.monotonic() - received
+            except Exception as e:
+                if isinstance(e, ConnectionError):
+                    self.state.invalidate()
+                self.finish(job, output_root, False, time.monotonic() - start, f"{type(e).__name__}: {e}",
+                            latency=latency)
+                return
+            self.finish(job, output_root, True, time.monotonic() - start, flags=flags, size=len(audio), audio=audio,
+                        latency=latency)
+
+    async def run(self, sources, output_root):
+        """sources: [(data_list, base_name), ...]，多个文件合并后统一按权重分组"""
+        started = time.monotonic()
+        jobs, skipped = build_merged_jobs(sources, output_root)
+        self.total = len(jobs)
+        for base_name, i in skipped:
+            self.emit({"event": "skipped", "file": base_name, "line": i + 1, "reason": "缺少 character 字段"})
+
+        # 各文件的运行清单分开保存，与单独生成时相同
+        base_names = [base_name for _, base_name in sources]
+        manifests = {base_name: RunManifest(output_root, base_name) for base_name in base_names}
+        self.telemetry = RunTelemetry(output_root, merged_run_name(base_names))
+        if self.resume:
+            remaining = [job for job in jobs if not manifests[job["base_name"]].is_complete(job)]
+            self.done = len(jobs) - len(remaining)
+            jobs = remaining
+        else:
+            for manifest in manifests.values():
+                manifest.reset()
+
+        # 后处理在进程池中进行，不占用事件循环
+        self.post = AudioPostProcessor(**self.postprocess) if self.postprocess is not None else None
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self.probe_lock = asyncio.Lock()
+        self.unavailable = None
+        # 刚启动、尚未加载完的服务先等待健康检查通过，而不是在前几条上耗尽重试
+        if not await self.probe():
+            self.breaker.trip()
+            self.emit({"event": "waiting", "url": self.base_url})
+        groups = {}
+        for job in order_by_weights(jobs):
+            groups.setdefault(job["weights"], []).append(job)
+        # 组内长句先发，并发的几路请求大致同时结束，不会只剩一条长句在最后单独合成
+        model = LatencyModel.from_telemetry(output_root)
+        for group in groups.values():
+            group.sort(key=lambda job: model.cost(job["data"]), reverse=True)
+
+        for weights, group in groups.items():
+            switch_start = time.monotonic()
+            try:
+                await self.switch_weights(weights)
+                group[0]["switch_time"] = time.monotonic() - switch_start  # 切换用时只算在组内第一条
+            except Exception as e:
+                for job in group:
+                    self.finish(job, output_root, False, error=f"切换权重失败 {e}")
+                continue
+            for job in group:
+                job["enqueued"] = switch_start
+            await asyncio.gather(*(self.synthesize(job, manifests[job["base_name"]], output_root, semaphore)
+                                   for job in group))
+
+        self.client.close()
+        for data_list, _ in sources:
+            data_list.close()
+        summary = {"event": "summary", "total": self.total, "done": self.done - self.failed,
+                   "failed": self.failed, "flagged": self.flagged, "skipped": len(skipped), "retries": self.retries}
+        if self.post is not None:
+            summary["post_done"], summary["post_failed"] = await asyncio.to_thread(self.post.wait)
+        summary["elapsed"] = round(time.monotonic() - started, 3)
+        telemetry = self.telemetry.close()
+        summary["telemetry"] = self.telemetry.path
+        summary["lines"] = format_summary(telemetry)
+        self.emit(summary)
+        return summary
+
+
+def print_event(event, as_json=False):
+    if as_json:
+        print(json.dumps(event, ensure_ascii=False), flush=True)
+        return
+    kind = event["event"]
+    if kind == "done" and event.get("flags"):
+        print(f"[{event['done']}/{event['total']}] ⚠️ {event['path']} ({event['elapsed']:.2f}s) "
+              f"质量检查未通过：{'；'.join(event['flags'])}", flush=True)
+    elif kind == "done":
+        print(f"[{event['done']}/{event['total']}] ✅ {event['path']} ({event['elapsed']:.2f}s)", flush=True)
+    elif kind == "failed":
+        print(f"[{event['done']}/{event['total']}] ❌ {event['path']}: {event.get('error')}", flush=True)
+    elif kind == "retry":
+        where = f"第 {event['line']} 条" if "line" in event else "切换权重"
+        print(f"↻ {where} {event['error']}，{event['delay']:.1f}s 后第 {event['attempt']} 次重试", flush=True)
+    elif kind == "paused":
+        print(f"⏸️ {event['url']} 连续请求失败，暂停并等待服务恢复（{event['error']}）", flush=True)
+    elif kind == "waiting":
+        print(f"⏳ {event['url']} 尚未就绪，健康检查通过后开始", flush=True)
+    elif kind == "unavailable":
+        print(f"❌ {event['url']} {event['wait']:.0f}s 内未恢复，剩余台词记为失败", flush=True)
+    elif kind == "resumed":
+        print(f"▶️ {event['url']} 已恢复", flush=True)
+    elif kind == "skipped":
+        print(f"⚠️ {event['file']} 第 {event['line']} 条跳过：{event['reason']}", flush=True)
+    elif kind == "summary":
+        print(f"🎉 完成 {event['done']}/{event['total']} 条，失败 {event['failed']} 条，"
+              f"跳过 {event['skipped']} 条，用时 {event['elapsed']:.1f}s", flush=True)
+        if event["flagged"]:
+            print(f"   质量检查未通过 {event['flagged']} 条，--resume 时会重新生成", flush=True)
+        for line in event["lines"]:
+            print(f"   {line}", flush=True)
+        print(f"   运行日志：{event['telemetry']}", flush=True)
+        if "post_done" in event:
+            print(f"   后处理完成 {event['post_done']} 条，失败 {event['post_failed']} 条", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量合成 JSONL 中的全部台词")
+    parser.add_argument("jsonl", nargs="+", help="输入 JSONL 文件，多个时合并生成")
+    parser.add_argument("output_root", help="输出根目录（按 角色/场景 分目录）")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时进行的请求数")
+    parser.add_argument("--url", default=DEFAULT_API_BASE, help="GPT-SoVITS API 地址")
+    parser.add_argument("--launch", action="store_true",
+                        help="在 --url 的端口上启动并守护 API 实例（命令见 supervisor.json），结束时停止")
+    parser.add_argument("--base-name", help="场景名，默认取 JSONL 文件名（去掉 _ja/_zh 后缀），只能用于单个文件")
+    parser.add_argument("--resume", action="store_true", help="跳过上次已完成的行")
+    parser.add_argument("--json", action="store_true", help="以 JSON 行输出进度")
+    parser.add_argument("--postprocess", action="store_true", help="去除首尾静音并统一响度（原地覆盖 WAV）")
+    parser.add_argument("--encode", choices=sorted(ENCODERS), help="额外用 ffmpeg 编码为同名 .ogg")
+    parser.add_argument("--no-quality", action="store_true", help="关闭质量检查（阈值见 quality.json）")
+    parser.add_argument("--quality-retries", type=int, default=0, help="未通过质量检查时的重试次数")
+    args = parser.parse_args(argv)
+
+    if args.base_name and len(args.jsonl) > 1:
+        parser.error("--base-name 只能用于单个文件")
+    # 普通 JSONL 或紧凑格式，逐行按需读取
+    sources = [(open_job_source(path), args.base_name or base_name_from_path(path)) for path in args.jsonl]
+    os.makedirs(args.output_root, exist_ok=True)
+
+    postprocess = None
+    if args.postprocess or args.encode:
+        postprocess = {"trim": args.postprocess, "normalize": args.postprocess, "encode": args.encode}
+
+    quality = None if args.no_quality else load_thresholds()
+    engine = BatchEngine(args.url, args.concurrency, args.resume, lambda event: print_event(event, args.json),
+                         postprocess, quality, args.quality_retries)
+    supervisor = None
+    if args.launch:
+        parts = urlsplit(args.url)
+        config = load_config()
+        config.update(host=parts.hostname, base_port=parts.port or 80, instances=1, min_instances=1, max_instances=1)
+        supervisor = BackendSupervisor(config, lambda message: print(message, file=sys.stderr, flush=True))
+        supervisor.start()
+    try:
+        summary = asyncio.run(engine.run(sources, args.output_root))
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    finally:
+        if supervisor is not None:
+            supervisor.stop()
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+
+from jsonl_source import JsonlSource, LazyJob
+
+
+# 只用于本工具、不影响合成结果的字段
+NON_SYNTH_FIELDS = ("character", "preset", "prompt", "streaming_mode")
+
+
+def canonical_payload(data):
+    """去掉不影响合成结果的字段，得到用于比较/缓存的请求内容"""
+    return {key: value for key, value in data.items() if key not in NON_SYNTH_FIELDS}
+
+
+def payload_hash(data):
+    """请求内容的规范化哈希"""
+    text = json.dumps(canonical_payload(data), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def base_name_from_path(jsonl_path):
+    """由 JSONL 文件名得到场景名，并自动移除语言后缀（如 _ja、_zh）"""
+    base_name = os.path.splitext(os.path.basename(jsonl_path))[0]
+    if base_name.endswith("_ja") or base_name.endswith("_zh"):
+        base_name = base_name.rsplit("_", 1)[0]
+    return base_name
+
+
+def split_base_name(base_name, character):
+    """拆分 base_name 为输出目录的角色与场景（例如 anon_test → anon, test）"""
+    if "_" in base_name:
+        folder_character, folder_scene = base_name.split("_", 1)
+    else:
+        folder_character, folder_scene = character, base_name
+    return folder_character, folder_scene
+
+
+def build_jobs(data_list, base_name, output_root):
+    """
+    按文件顺序为每一行分配输出文件名，编号规则与顺序生成完全一致
+
+    Args:
+        data_list: JSONL 解析后的配置列表，或 JsonlSource（此时任务不保存请求内容，按需读取）
+        base_name: 场景名（JSONL 文件名去掉扩展名）
+        output_root: 输出根目录
+
+    Returns:
+        (jobs, skipped)：jobs 为任务字典列表，skipped 为缺少 character 字段的行号列表
+    """
+    jobs = []
+    skipped = []
+    character_counters = {}  # 每个角色当前编号（无论是否成功，都会前进）
+    output_dirs = {}  # 同一角色共用目录字符串
+    lazy = isinstance(data_list, JsonlSource)
+    if lazy:
+        data_list.refresh()  # 文件在上次运行后被重新生成或编辑过时，重新建立行偏移索引
+
+    for i, data in enumerate(data_list):
+        character = data.get("character", "unknown")
+        if character == "unknown":
+            skipped.append(i)
+            continue
+
+        character_counters[character] = character_counters.get(character, 0) + 1
+        index_number = character_counters[character]
+
+        folder_character, folder_scene = split_base_name(base_name, character)
+        filename = f"{character}_{folder_scene}_{index_number:02d}.wav"
+        output_dir = output_dirs.get(character)
+        if output_dir is None:
+            output_dir = output_dirs[character] = os.path.join(output_root, folder_character, folder_scene)
+
+        job = {
+            "line": i,
+            "character": character,
+            "filename": filename,
+            "output_dir": output_dir,
+            "output_path": os.path.join(output_dir, filename),
+            "weights": (data.get("gpt_weight"), data.get("sovits_weight")),
+        }
+        if lazy:
+            job = LazyJob(data_list, job)
+        else:
+            job["data"] = data
+        jobs.append(job)
+
+    return jobs, skipped
+
+
+def build_merged_jobs(sources, output_root):
+    """
+    把多个任务文件（如一章的各个场景）合并为一次生成
+
+    每个文件仍按 build_jobs 独立编号，输出落在各自的 {角色}/{场景} 目录；
+    任务上额外记录 base_name，之后对全部任务统一 order_by_weights，每组权重在整章中只加载一次。
+
+    Args:
+        sources: [(data_list, base_name), ...]
+    Returns:
+        (jobs, skipped)：skipped 为 (base_name, 行号) 列表
+    """
+    jobs = []
+    skipped = []
+    seen = set()
+    for data_list, base_name in sources:
+        # 同名场景（如 _ja 与 _zh 两个版本）会写到相同的文件
+        if base_name in seen:
+            raise ValueError(f"场景名重复：{base_name}")
+        seen.add(base_name)
+        file_jobs, file_skipped = build_jobs(data_list, base_name, output_root)
+        for job in file_jobs:
+            job["base_name"] = base_name
+        jobs.extend(file_jobs)
+        skipped.extend((base_name, i) for i in file_skipped)
+    return jobs, skipped
+
+
+def merged_run_name(base_names):
+    """合并生成时运行日志使用的名称"""
+    if len(base_names) == 1:
+        return base_names[0]
+    return f"{base_names[0]}+{len(base_names) - 1}"
+
+
+def order_by_weights(jobs, loaded=(None, None)):
+    """
+    按权重对重排任务，使每组权重只加载一次
+
+    同一权重对内保持文件顺序；GPT 权重相同的组相邻排列，
+    这样 GPT 权重的切换次数也降到最少。若给出当前已加载的权重，优先处理该组。
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job["weights"], []).append(job)
+
+    # 先按 GPT 权重首次出现的顺序归并，再在组内按 SoVITS 权重首次出现排列
+    gpt_order = {}
+    for gpt_weight, _ in groups:
+        gpt_order.setdefault(gpt_weight, len(gpt_order))
+    pairs = sorted(groups, key=lambda pair: gpt_order[pair[0]])
+
+    if loaded in groups:
+        pairs.remove(loaded)
+        same_gpt = [pair for pair in pairs if pair[0] == loaded[0]]
+        others = [pair for pair in pairs if pair[0] != loaded[0]]
+        pairs = [loaded] + same_gpt + others
+
+    ordered = []
+    for pair in pairs:
+        ordered.extend(groups[pair])
+    return ordered
+
+
+def count_weight_switches(jobs, loaded=(None, None)):
+    """统计按给定顺序执行时需要的权重切换次数"""
+    switches = 0
+    for job in jobs:
+        if job["weights"] != loaded:
+            switches += 1
+            loaded = job["weights"]
+    return switches
@@ -0,0 +1,100 @@
+import time
+import threading
+
+import requests
+
+
+# api_v2 无法查询已加载的权重：超过这么久没有成功通信的记录不再可信（期间服务端可能已重启）
+MAX_AGE = 600
+KINDS = ("gpt", "sovits")
+
+
+class WeightsState:
+    """
+    一个 API 实例上当前加载的 (gpt, sovits) 权重，进程内所有调用方共用（见 get_weights_state）
+
+    切换成功后记录，进程内的多次运行（批量生成、重新生成等）之间保留；同一实例的切换在锁内串行进行，
+    只发送与当前不同的那一半。api_v2 无法查询已加载的权重，只在有证据表明服务端可能已变化时清空：
+    请求遇到连接错误、健康探测失败后恢复（服务端重启过）、守护进程启动或重启实例，
+    以及超过 MAX_AGE 没有成功通信。记录只在本进程内有效，不采信其他进程的切换。
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.lock = threading.RLock()
+        self.weights = {kind: None for kind in KINDS}
+        self.last_seen = 0.0  # 最近一次成功通信的时间
+
+    def __repr__(self):
+        return f"WeightsState({self.base_url}, {self.loaded})"
+
+    @property
+    def loaded(self):
+        with self.lock:
+            if time.time() - self.last_seen > MAX_AGE:
+                return (None, None)
+            return tuple(self.weights[kind] for kind in KINDS)
+
+    def needed(self, weights):
+        """返回需要发送的 [(kind, 路径), ...]；路径为空的一半不切换"""
+        loaded = self.loaded
+        return [(kind, path) for kind, path, current in zip(KINDS, weights, loaded) if path and path != current]
+
+    def confirm(self, kind, path):
+        with self.lock:
+            self.weights[kind] = path
+            self.last_seen = time.time()
+
+    def forget(self, kind):
+        """切换失败时该半边的状态未知"""
+        with self.lock:
+            self.weights[kind] = None
+
+    def invalidate(self):
+        with self.lock:
+            self.weights = {kind: None for kind in KINDS}
+
+    def touch(self):
+        """请求成功，说明服务端仍是同一个进程在运行"""
+        with self.lock:
+            self.last_seen = time.time()
+
+    def switch(self, client, weights):
+        """
+        通过 tts_client.TTSClient 切换到 weights，已加载的一半不再发送
+
+        Returns:
+            实际切换的 kind 列表
+        Raises:
+            requests.RequestException：切换失败，该半边（连接失败时为全部）的状态被清空
+        """
+        with self.lock:
+            switched = []
+            for kind, path in self.needed(weights):
+                setter = client.set_gpt_weights if kind == "gpt" else client.set_sovits_weights
+                try:
+                    response = setter(path)
+                    response.raise_for_status()
+                except requests.ConnectionError:
+                    self.invalidate()  # 服务端关闭或正在重启，恢复后两半都需要重新加载
+                    raise
+                except requests.RequestException:
+                    self.forget(kind)
+                    raise
+                self.confirm(kind, path)
+                switched.append(kind)
+            return switched
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get_weights_state(base_url):
+    """按地址获取共享的权重状态，同一实例的所有调用方共用一份"""
+    key = base_url.rstrip("/")
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = WeightsState(key)
+        return state